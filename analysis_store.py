@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from disk_cache import CACHE_DIR
+from urls import url_key
+
+load_dotenv()
+# Keep every analysis' link selection, page hashes and summary, and reuse them when a
+# refresh finds the site unchanged
+INCREMENTAL_ANALYSIS = os.getenv("INCREMENTAL_ANALYSIS", "false").lower() in ("1", "true", "yes")
+ANALYSIS_DB_PATH = os.getenv("ANALYSIS_DB_PATH", os.path.join(CACHE_DIR, "analyses.sqlite"))
+ANALYSIS_RETENTION_SECONDS = float(os.getenv("ANALYSIS_RETENTION_SECONDS", str(30 * 24 * 3600)))  # 30 days
+
+
+def content_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def link_set_hash(links):
+    """
+    A hash of a set of links that ignores their order and trivial spelling differences.
+    """
+    return content_hash("\n".join(sorted({url_key(link) for link in links})))
+
+
+@dataclass
+class StoredAnalysis:
+    """
+    What the last analysis of a URL left for the next one to reuse.
+    """
+
+    links_hash: str = None
+    selection: dict = None
+    pages: dict = field(default_factory=dict)  # page url -> content hash
+    summary_key: str = None
+    summary: str = None
+    updated_at: float = 0.0
+
+    def changed_pages(self, pages):
+        """
+        The URLs of pages added, removed or changed since this analysis.
+        """
+        return sorted(url for url in self.pages.keys() | pages.keys() if self.pages.get(url) != pages.get(url))
+
+
+class AnalysisStore:
+    """
+    Persists the state of incremental analyses in SQLite, one row per API key ID, URL
+    and model, so an analysis is only ever reused for the tenant that paid for it.
+
+    The link selection is stored together with a hash of the link set it was made
+    from, and the summary together with a key over the content hashes of the pages
+    (and the company name and summary mode) it was generated from. Rows not updated
+    within the retention period are dropped.
+    """
+
+    def __init__(self, path=ANALYSIS_DB_PATH, retention_seconds=ANALYSIS_RETENTION_SECONDS):
+        db_dir = os.path.dirname(path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # Stores created before analyses were scoped to an API key cannot tell whose
+            # they are, so their rows are dropped rather than shared
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(analyses)")}
+            if columns and "key_id" not in columns:
+                self._connection.execute("DROP TABLE analyses")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS analyses (
+                    key_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    links_hash TEXT,
+                    selection TEXT,
+                    pages TEXT,
+                    summary_key TEXT,
+                    summary TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (key_id, url, model)
+                )
+                """
+            )
+
+    def get(self, key_id, url, model):
+        """
+        Return the StoredAnalysis of a URL and model for an API key ID, or None.
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT links_hash, selection, pages, summary_key, summary, updated_at"
+                " FROM analyses WHERE key_id = ? AND url = ? AND model = ?",
+                (key_id, url_key(url), model),
+            ).fetchone()
+            if row is None:
+                return None
+            links_hash, selection, pages, summary_key, summary, updated_at = row
+            if time.time() - updated_at >= self.retention_seconds:
+                self._connection.execute(
+                    "DELETE FROM analyses WHERE key_id = ? AND url = ? AND model = ?",
+                    (key_id, url_key(url), model),
+                )
+                return None
+        return StoredAnalysis(
+            links_hash=links_hash,
+            selection=json.loads(selection) if selection else None,
+            pages=json.loads(pages) if pages else {},
+            summary_key=summary_key,
+            summary=summary,
+            updated_at=updated_at,
+        )
+
+    def save_links(self, key_id, url, model, links_hash, selection):
+        """
+        Store the link selection made from the link set with the given hash.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                INSERT INTO analyses (key_id, url, model, links_hash, selection, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key_id, url, model) DO UPDATE SET
+                    links_hash = excluded.links_hash,
+                    selection = excluded.selection,
+                    updated_at = excluded.updated_at
+                """,
+                (key_id, url_key(url), model, links_hash, json.dumps(selection), time.time()),
+            )
+
+    def save_summary(self, key_id, url, model, pages, summary_key, summary):
+        """
+        Store a summary with the page hashes and summary key it was generated from.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                INSERT INTO analyses (key_id, url, model, pages, summary_key, summary, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key_id, url, model) DO UPDATE SET
+                    pages = excluded.pages,
+                    summary_key = excluded.summary_key,
+                    summary = excluded.summary,
+                    updated_at = excluded.updated_at
+                """,
+                (key_id, url_key(url), model, json.dumps(pages, sort_keys=True), summary_key, summary, time.time()),
+            )
+
+
+_analysis_store = None
+_analysis_store_lock = threading.Lock()
+
+
+def get_analysis_store():
+    """
+    Return the process-wide AnalysisStore, or None when INCREMENTAL_ANALYSIS is off.
+    """
+    global _analysis_store
+    if not INCREMENTAL_ANALYSIS:
+        return None
+    with _analysis_store_lock:
+        if _analysis_store is None:
+            _analysis_store = AnalysisStore()
+        return _analysis_store
@@ -0,0 +1,125 @@
+import asyncio
+import os
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+from completion_cache import acached_completion
+from logger import configured_logger
+from main import MODEL, aget_relevant_links, aprepare_summary
+from metrics import span, trace
+from pages import PageCache
+
+load_dotenv()
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_PER_DOMAIN_CONCURRENCY = int(os.getenv("BATCH_PER_DOMAIN_CONCURRENCY", "2"))
+
+
+def domain_of(url):
+    return (urlsplit(url).hostname or "").lower()
+
+
+class DomainSession:
+    """
+    State shared by the batch items of one domain.
+
+    Items on the same domain share a PageCache, so every page is fetched and parsed
+    once per batch, and the link selection of each landing page, so the link-selection
+    completion runs once. The semaphore bounds how many of the domain's items run at once.
+    """
+
+    def __init__(self, per_domain_concurrency=BATCH_PER_DOMAIN_CONCURRENCY):
+        self.page_cache = PageCache()
+        self.semaphore = asyncio.Semaphore(per_domain_concurrency)
+        self._link_selections = {}  # (url, model) -> Task
+
+    async def select_links(self, url, page_cache=None, client=None, model=None):
+        """
+        Link selector for iter_content_from_relevant_links(): runs aget_relevant_links()
+        once per landing page and model, later items await the same result.
+        """
+        key = (url, model)
+        task = self._link_selections.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                aget_relevant_links(url, page_cache=self.page_cache, client=client, model=model)
+            )
+            self._link_selections[key] = task
+        # A cancelled item must not cancel the selection other items are waiting for
+        return await asyncio.shield(task)
+
+    def close(self):
+        for task in self._link_selections.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Every waiting item already saw a failure; mark it as retrieved
+                task.exception()
+
+
+async def analyze_item(index, company_name, url, session, global_limit, client, model):
+    """
+    Run one batch item and return its result (a summary or an error) as a dict.
+    """
+    result = {"index": index, "company_name": company_name, "url": url}
+    # Wait for the domain first, so items of a busy domain do not hold global slots
+    async with session.semaphore, global_limit:
+        with trace() as trace_id, span("batch_item", url=url):
+            result["trace_id"] = trace_id
+            try:
+                prepared = await aprepare_summary(
+                    company_name,
+                    url,
+                    client=client,
+                    model=model,
+                    page_cache=session.page_cache,
+                    link_selector=session.select_links,
+                )
+                summary = prepared.summary
+                if summary is None:
+                    summary = await acached_completion(client, model, prepared.messages)
+                    await prepared.save(summary)
+                result["summary"] = summary
+            except Exception as e:
+                configured_logger.error("Batch item %d (%s) failed: %s", index, url, e)
+                result["error"] = str(e)
+    return result
+
+
+async def analyze_batch(
+    items,
+    client,
+    model=None,
+    concurrency=BATCH_CONCURRENCY,
+    per_domain_concurrency=BATCH_PER_DOMAIN_CONCURRENCY,
+):
+    """
+    Analyze (company_name, url) items concurrently and yield each item's result as
+    soon as it is ready, in completion order.
+
+    At most `concurrency` items run at once, and at most `per_domain_concurrency`
+    per domain. Closing the generator cancels the items still running.
+    """
+    model = model or MODEL
+    global_limit = asyncio.Semaphore(concurrency)
+    sessions = {}
+    tasks = []
+    for index, (company_name, url) in enumerate(items):
+        domain = domain_of(url)
+        if domain not in sessions:
+            sessions[domain] = DomainSession(per_domain_concurrency)
+        tasks.append(
+            asyncio.create_task(
+                analyze_item(index, company_name, url, sessions[domain], global_limit, client, model)
+            )
+        )
+    configured_logger.info(
+        "Analyzing a batch of %d items across %d domains", len(tasks), len(sessions)
+    )
+
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+        for session in sessions.values():
+            session.close()
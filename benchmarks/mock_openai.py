@@ -0,0 +1,184 @@
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RELEVANT_KEYWORDS = ("about", "careers", "jobs", "team", "customers")
+URL_LINE = re.compile(r"^https?://\S+$")
+
+
+class MockOpenAI:
+    """
+    A local OpenAI-compatible chat completions server.
+
+    JSON-mode requests (link selection) answer with a {"links": [...]} object built
+    from the link list in the prompt; other requests answer with a synthetic markdown
+    summary, either at once or as an SSE stream at a fixed token rate. Point the SDK
+    at it with OPENAI_BASE_URL=<server.url>.
+    """
+
+    def __init__(
+        self,
+        latency_ms=50.0,
+        tokens_per_second=200.0,
+        summary_tokens=300,
+        max_links=8,
+        port=0,
+    ):
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.summary_tokens = summary_tokens
+        self.max_links = max_links
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def select_links(self, prompt):
+        links = []
+        for line in prompt.splitlines():
+            line = line.strip()
+            if URL_LINE.match(line) and any(k in line for k in RELEVANT_KEYWORDS):
+                section = next(k for k in RELEVANT_KEYWORDS if k in line)
+                links.append({"type": f"{section} page", "url": line})
+            if len(links) >= self.max_links:
+                break
+        return json.dumps({"links": links})
+
+    def summary_words(self):
+        words = ["# Acme Corp\n\n"]
+        for i in range(self.summary_tokens):
+            words.append("\n\n## Section\n\n" if i and i % 60 == 0 else "word ")
+        return words
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                with mock._lock:
+                    mock.requests += 1
+                length = int(self.headers.get("Content-Length", "0"))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json({"error": {"message": "not found"}}, status=404)
+                    return
+
+                time.sleep(mock.latency_ms / 1000)
+                messages = request.get("messages", [])
+                prompt = "\n".join(str(m.get("content", "")) for m in messages)
+                model = request.get("model", "mock")
+                usage = {"prompt_tokens": len(prompt) // 4}
+
+                if (request.get("response_format") or {}).get("type") == "json_object":
+                    content = mock.select_links(prompt)
+                    usage["completion_tokens"] = len(content) // 4
+                    self._send_completion(model, content, usage)
+                elif request.get("stream"):
+                    include_usage = (request.get("stream_options") or {}).get("include_usage")
+                    self._send_stream(model, mock.summary_words(), usage, include_usage)
+                else:
+                    words = mock.summary_words()
+                    time.sleep(len(words) / mock.tokens_per_second)
+                    usage["completion_tokens"] = len(words)
+                    self._send_completion(model, "".join(words), usage)
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_completion(self, model, content, usage):
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                self._send_json(
+                    {
+                        "id": f"chatcmpl-{uuid.uuid4().hex}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": usage,
+                    }
+                )
+
+            def _write_event(self, payload):
+                data = b"data: " + (payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")) + b"\n\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _send_stream(self, model, words, usage, include_usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+                delay = 1 / mock.tokens_per_second
+                for word in words:
+                    delta = {"role": "assistant", "content": word}
+                    self._write_event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+                    time.sleep(delay)
+                self._write_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if include_usage:
+                    usage["completion_tokens"] = len(words)
+                    usage["total_tokens"] = usage["prompt_tokens"] + len(words)
+                    self._write_event({**base, "choices": [], "usage": usage})
+                self._write_event(b"[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="mock-openai", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI chat completions API")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--summary-tokens", type=int, default=300)
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+
+    mock = MockOpenAI(args.latency_ms, args.tokens_per_second, args.summary_tokens, port=args.port).start()
+    print(f"Mock OpenAI API at {mock.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
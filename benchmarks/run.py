@@ -0,0 +1,193 @@
+"""
+Offline benchmarks for crawling, parsing, relevant-page collection and /api/analyze/.
+
+Every scenario runs against a local SiteFarm and MockOpenAI server, so no network
+access or OpenAI key is needed:
+
+    python -m benchmarks.run --scenario all
+    python -m benchmarks.run --scenario analyze --requests 50 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_openai import MockOpenAI
+from benchmarks.site_farm import SiteFarm
+
+SCENARIOS = ("crawl", "parse", "content", "analyze")
+
+
+def configure_environment(mock, warm):
+    """
+    Point the app at the mock OpenAI server and a throwaway cache directory. This
+    must run before any application module is imported, since they read their
+    settings at import time.
+    """
+    os.environ["OPENAI_BASE_URL"] = mock.url
+    os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+    os.environ.setdefault("MODEL", "gpt-4o-mini")
+    os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="benchmark-cache-")
+    enabled = "true" if warm else "false"
+    os.environ["PAGE_CACHE_ENABLED"] = enabled
+    os.environ["COMPLETION_CACHE_ENABLED"] = enabled
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "p50_ms": round(pick(50) * 1000, 1),
+        "p95_ms": round(pick(95) * 1000, 1),
+        "p99_ms": round(pick(99) * 1000, 1),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 1),
+    }
+
+
+def bench_crawl(farm, args):
+    from crawler import AsyncCrawler, run_sync
+    from pages import PageCache
+
+    samples = []
+    for _ in range(args.iterations):
+        crawler = AsyncCrawler(max_depth=args.depth, page_cache=PageCache())
+        start = time.perf_counter()
+        result = run_sync(crawler.crawl(farm.url))
+        elapsed = time.perf_counter() - start
+        samples.append((len(result.pages), elapsed))
+
+    pages = sum(count for count, _ in samples)
+    elapsed = sum(seconds for _, seconds in samples)
+    return {
+        "pages_per_crawl": samples[-1][0],
+        "pages_per_sec": round(pages / elapsed, 1),
+        **percentiles([seconds for _, seconds in samples]),
+    }
+
+
+def bench_parse(farm, args):
+    from extractors import EXTRACTORS, etree
+
+    body = farm.render(0)
+    report = {"page_bytes": len(body)}
+    for name, extractor_class in EXTRACTORS.items():
+        if name == "lxml" and etree is None:
+            continue
+        extractor = extractor_class()
+        samples = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            extractor.extract(farm.url, body)
+            samples.append(time.perf_counter() - start)
+        report[name] = percentiles(samples)
+    return report
+
+
+def bench_content(farm, args):
+    from main import get_content_from_relevant_links
+
+    samples = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        get_content_from_relevant_links(farm.url)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def bench_analyze(farm, args):
+    import httpx
+    from fastapi import FastAPI
+    from router import router
+
+    # The router alone, so the benchmark does not depend on server.py's deployment setup
+    app = FastAPI()
+    app.include_router(router)
+    payload = {
+        "company_name": "Acme Corp",
+        "url": farm.url,
+        "openai_secret_key": os.environ["OPENAI_API_KEY"],
+        "gpt_model": os.environ["MODEL"],
+    }
+
+    async def run():
+        limit = asyncio.Semaphore(args.concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+
+            async def one():
+                async with limit:
+                    start = time.perf_counter()
+                    response = await client.post("/api/analyze/", json=payload)
+                    response.raise_for_status()
+                    return time.perf_counter() - start
+
+            started = time.perf_counter()
+            samples = await asyncio.gather(*(one() for _ in range(args.requests)))
+            return samples, time.perf_counter() - started
+
+    samples, elapsed = asyncio.run(run())
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "requests_per_sec": round(args.requests / elapsed, 2),
+        **percentiles(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--pages", type=int, default=200, help="Pages in the synthetic site")
+    parser.add_argument("--fanout", type=int, default=20, help="Links on each content page")
+    parser.add_argument("--page-bytes", type=int, default=20_000, help="Approximate size of each page")
+    parser.add_argument("--site-latency-ms", type=float, default=20.0, help="Delay added to every page")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="Delay before each completion")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Streaming rate of the mock model")
+    parser.add_argument("--depth", type=int, default=2, help="Crawl depth of the crawl scenario")
+    parser.add_argument("--iterations", type=int, default=5, help="Repetitions of the crawl, parse and content scenarios")
+    parser.add_argument("--requests", type=int, default=20, help="Requests sent by the analyze scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent requests of the analyze scenario")
+    parser.add_argument("--warm", action="store_true", help="Keep the page and completion caches enabled")
+    args = parser.parse_args()
+
+    farm = SiteFarm(args.pages, args.fanout, args.page_bytes, args.site_latency_ms)
+    mock = MockOpenAI(args.llm_latency_ms, args.tokens_per_second)
+    configure_environment(mock, args.warm)
+
+    benchmarks = {
+        "crawl": bench_crawl,
+        "parse": bench_parse,
+        "content": bench_content,
+        "analyze": bench_analyze,
+    }
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+
+    results = {}
+    with farm, mock:
+        for scenario in scenarios:
+            requests_before = farm.requests
+            report = benchmarks[scenario](farm, args)
+            report["site_requests"] = farm.requests - requests_before
+            report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+            results[scenario] = report
+            print(f"{scenario}: {json.dumps(report)}", file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
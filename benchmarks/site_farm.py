@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECTIONS = ["about", "careers", "jobs", "team", "customers", "blog", "news", "pricing", "contact", "privacy"]
+WORDS = (
+    "company mission customers product platform team culture growth engineering "
+    "design values remote office hiring investors partners global service quality"
+).split()
+
+
+class SiteFarm:
+    """
+    A local HTTP server for a synthetic company website.
+
+    "/" is the landing page, linking to every page, and "/<section>/<n>" are content
+    pages, each linking to `fanout` other pages. Pages are generated from their number,
+    so a site is fully described by its page count, fan-out, page size and injected
+    latency. Pages carry ETags so conditional revalidation can be exercised too.
+    """
+
+    def __init__(self, pages=200, fanout=20, page_bytes=20_000, latency_ms=0.0, port=0, seed=7):
+        self.pages = pages
+        self.fanout = fanout
+        self.page_bytes = page_bytes
+        self.latency_ms = latency_ms
+        self.seed = seed
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def page_path(self, number):
+        return f"/{SECTIONS[number % len(SECTIONS)]}/{number}"
+
+    def render(self, number):
+        """
+        Return the HTML of page `number` (-1 is the landing page).
+        """
+        rng = random.Random(self.seed * 1_000_003 + number)
+        title = "Acme Corp" if number < 0 else f"Acme {SECTIONS[number % len(SECTIONS)].title()} {number}"
+
+        if number < 0:
+            targets = range(self.pages)
+        else:
+            targets = (rng.randrange(self.pages) for _ in range(self.fanout))
+        nav = "".join(
+            f'<li><a href="{self.page_path(t)}">{SECTIONS[t % len(SECTIONS)]} {t}</a></li>' for t in targets
+        )
+
+        paragraphs = []
+        size = len(nav)
+        while size < self.page_bytes:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 30)))
+            paragraphs.append(f"<p>{sentence.capitalize()}.</p>")
+            size += len(sentence) + 8
+
+        return (
+            f"<!doctype html><html><head><title>{title}</title>"
+            f"<style>body{{font-family:sans-serif}}</style></head><body>"
+            f"<header><nav><ul>{nav}</ul></nav></header><main><h1>{title}</h1>{''.join(paragraphs)}</main>"
+            f"<script>window.analytics=[];</script><footer>Copyright Acme Corp</footer></body></html>"
+        ).encode("utf-8")
+
+    def _handler(self):
+        farm = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with farm._lock:
+                    farm.requests += 1
+                if farm.latency_ms:
+                    time.sleep(farm.latency_ms / 1000)
+
+                path = self.path.split("?", 1)[0].split("#", 1)[0]
+                if path == "/":
+                    number = -1
+                else:
+                    try:
+                        number = int(path.rstrip("/").rsplit("/", 1)[-1])
+                    except ValueError:
+                        number = None
+                if number is None or number >= farm.pages:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                body = farm.render(number)
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="site-farm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a synthetic website")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--fanout", type=int, default=20)
+    parser.add_argument("--page-bytes", type=int, default=20_000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8800)
+    args = parser.parse_args()
+
+    farm = SiteFarm(args.pages, args.fanout, args.page_bytes, args.latency_ms, args.port).start()
+    print(f"Serving {args.pages} pages at {farm.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        farm.stop()
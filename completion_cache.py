@@ -0,0 +1,347 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import openai
+from dotenv import load_dotenv
+from disk_cache import CACHE_DIR
+from logger import configured_logger
+from metrics import CACHE_LOOKUPS, LLM_TIME_TO_FIRST_TOKEN, record_usage
+from scheduler import Scheduler, parse_retry_after
+from singleflight import SingleFlight
+
+load_dotenv()
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPLETION_CACHE_MEMORY_ENTRIES = int(os.getenv("COMPLETION_CACHE_MEMORY_ENTRIES", "256"))
+COMPLETION_CACHE_TTL_SECONDS = float(os.getenv("COMPLETION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))  # 7 days
+# Requests per second per API key (0 = unlimited, pacing then comes from Retry-After alone)
+OPENAI_RATE = float(os.getenv("OPENAI_RATE", "0"))
+OPENAI_BURST = float(os.getenv("OPENAI_BURST", "16"))
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "16"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))
+
+# Ask streams for a final usage chunk, so streamed token usage is counted too
+STREAM_OPTIONS = {"include_usage": True}
+
+# Identical concurrent async requests made with the same API key share one API call
+# (keyed by completion_key)
+_completion_flight = SingleFlight("completion")
+_stream_flight = SingleFlight("completion_stream")
+
+
+def _classify(error):
+    """
+    Whether a failed API call is worth retrying, and the delay the API asked for.
+    """
+    if isinstance(error, (openai.RateLimitError, openai.InternalServerError)):
+        return True, parse_retry_after(error.response.headers)
+    # Includes openai.APITimeoutError
+    return isinstance(error, openai.APIConnectionError), None
+
+
+def _key_id(client):
+    # Identifies an API key without the key itself, which must never be logged
+    return hashlib.sha256((client.api_key or "").encode("utf-8")).hexdigest()[:32]
+
+
+# Paces, bounds and retries API calls per API key
+api_scheduler = Scheduler(
+    "openai",
+    _classify,
+    rate=OPENAI_RATE,
+    burst=OPENAI_BURST,
+    concurrency=OPENAI_CONCURRENCY,
+    max_concurrency=OPENAI_MAX_CONCURRENCY,
+    # Completion latency grows with the output length, so only 429s, 5xx and timeouts
+    # lower the limit
+    latency_tolerance=None,
+)
+
+
+def completion_key(key_id, model, messages, **params):
+    """
+    Content address of a completion: a hash of the model, every message and any
+    request parameters that change the output (e.g. response_format).
+
+    The ID of the API key is part of it, so completions are only ever reused for
+    the tenant that paid for them: a revoked or invalid key gets no cache hits.
+    """
+    payload = json.dumps(
+        {"key_id": key_id, "model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    A two-tier completion cache: an in-memory LRU in front of a SQLite table.
+    """
+
+    def __init__(
+        self,
+        path=os.path.join(CACHE_DIR, "completions.sqlite"),
+        memory_entries=COMPLETION_CACHE_MEMORY_ENTRIES,
+        ttl_seconds=COMPLETION_CACHE_TTL_SECONDS,
+    ):
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()  # key -> (content, created_at)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _remember(self, key, content, created_at):
+        self._memory[key] = (content, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Return the cached completion text for a key, or None.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                return entry[0]
+
+            with self._connection:
+                row = self._connection.execute(
+                    "SELECT content, created_at FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                content, created_at = row
+                if now - created_at >= self.ttl_seconds:
+                    self._connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    self._memory.pop(key, None)
+                    return None
+
+            self._remember(key, content, created_at)
+            return content
+
+    def put(self, key, model, content):
+        """
+        Store a completed response in both tiers.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, content, now)
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO completions (key, model, content, created_at) VALUES (?, ?, ?, ?)",
+                    (key, model, content, now),
+                )
+
+    def invalidate(self, key):
+        """
+        Forget a cached completion, e.g. one that turned out to be unusable.
+        """
+        with self._lock:
+            self._memory.pop(key, None)
+            with self._connection:
+                self._connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+
+
+_completion_cache = None
+_completion_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    """
+    Return the process-wide CompletionCache, or None when COMPLETION_CACHE_ENABLED is off.
+    """
+    global _completion_cache
+    if not COMPLETION_CACHE_ENABLED:
+        return None
+    with _completion_cache_lock:
+        if _completion_cache is None:
+            _completion_cache = CompletionCache()
+        return _completion_cache
+
+
+def invalidate_completion(client, model, messages, **params):
+    """
+    Drop the cached completion for a request whose response could not be used.
+    """
+    cache = get_completion_cache()
+    if cache is not None:
+        cache.invalidate(completion_key(_key_id(client), model, messages, **params))
+
+
+def replay_chunks(content):
+    """
+    Split a cached completion back into stream chunks, one line at a time.
+    """
+    return iter(content.splitlines(keepends=True))
+
+
+def cached_completion(client, model, messages, **params):
+    """
+    Return the text of a chat completion, calling the API only on a cache miss.
+    """
+    cache = get_completion_cache()
+    key = completion_key(_key_id(client), model, messages, **params)
+    if cache is not None:
+        content = cache.get(key)
+        CACHE_LOOKUPS.inc(cache="completion", result="miss" if content is None else "hit")
+        if content is not None:
+            configured_logger.info("Completion cache hit for %s (%s)", model, key[:12])
+            return content
+
+    response = api_scheduler.run(
+        _key_id(client), lambda: client.chat.completions.create(model=model, messages=messages, **params)
+    )
+    record_usage(model, response.usage)
+    content = response.choices[0].message.content
+    if cache is not None and content is not None:
+        cache.put(key, model, content)
+    return content
+
+
+def _record_stream(stream, cache, key, model, started):
+    parts = []
+    for chunk in stream:
+        record_usage(model, chunk.usage)
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content is not None:
+            if not parts:
+                LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started, model=model)
+            content = chunk.choices[0].delta.content
+            parts.append(content)
+            yield content
+
+    # Only completed streams are cached; an abandoned one never reaches this point
+    if cache is not None:
+        cache.put(key, model, "".join(parts))
+
+
+def cached_stream(client, model, messages, **params):
+    """
+    Return an iterator of content chunks for a streamed chat completion.
+
+    A cache hit is replayed as a stream, so callers behave the same either way. On a
+    miss the API call is made eagerly (errors surface here, not on first iteration)
+    and the full text is cached once the stream completes.
+    """
+    cache = get_completion_cache()
+    key = completion_key(_key_id(client), model, messages, **params)
+    if cache is not None:
+        content = cache.get(key)
+        CACHE_LOOKUPS.inc(cache="completion", result="miss" if content is None else "hit")
+        if content is not None:
+            configured_logger.info("Completion cache hit for %s (%s)", model, key[:12])
+            return replay_chunks(content)
+
+    started = time.perf_counter()
+    # Only opening the stream is retried; chunks already handed out cannot be taken back
+    stream = api_scheduler.run(
+        _key_id(client),
+        lambda: client.chat.completions.create(
+            model=model, messages=messages, stream=True, stream_options=STREAM_OPTIONS, **params
+        ),
+    )
+    return _record_stream(stream, cache, key, model, started)
+
+
+async def acached_completion(client, model, messages, **params):
+    """
+    Async counterpart of cached_completion() for an AsyncOpenAI client.
+
+    Concurrent identical requests (e.g. link selection over the same link list)
+    share one API call.
+    """
+    cache = get_completion_cache()
+    key = completion_key(_key_id(client), model, messages, **params)
+    if cache is not None:
+        content = await asyncio.to_thread(cache.get, key)
+        CACHE_LOOKUPS.inc(cache="completion", result="miss" if content is None else "hit")
+        if content is not None:
+            configured_logger.info("Completion cache hit for %s (%s)", model, key[:12])
+            return content
+
+    async def complete():
+        response = await api_scheduler.arun(
+            _key_id(client), lambda: client.chat.completions.create(model=model, messages=messages, **params)
+        )
+        record_usage(model, response.usage)
+        content = response.choices[0].message.content
+        if cache is not None and content is not None:
+            await asyncio.to_thread(cache.put, key, model, content)
+        return content
+
+    # The key includes the API key ID: a caller never shares another tenant's call, nor its errors
+    return await _completion_flight.do(key, complete)
+
+
+async def _areplay_chunks(content):
+    for chunk in replay_chunks(content):
+        yield chunk
+
+
+async def _arecord_stream(stream, cache, key, model, started):
+    parts = []
+    async for chunk in stream:
+        record_usage(model, chunk.usage)
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content is not None:
+            if not parts:
+                LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started, model=model)
+            content = chunk.choices[0].delta.content
+            parts.append(content)
+            yield content
+
+    # Only completed streams are cached; an abandoned one never reaches this point
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, model, "".join(parts))
+
+
+async def acached_stream(client, model, messages, **params):
+    """
+    Async counterpart of cached_stream(): returns an async iterator of content chunks.
+
+    Concurrent identical requests share one API stream, whose chunks are multicast
+    to every caller; a caller arriving mid-stream first receives what it missed.
+    """
+    cache = get_completion_cache()
+    key = completion_key(_key_id(client), model, messages, **params)
+    if cache is not None:
+        content = await asyncio.to_thread(cache.get, key)
+        CACHE_LOOKUPS.inc(cache="completion", result="miss" if content is None else "hit")
+        if content is not None:
+            configured_logger.info("Completion cache hit for %s (%s)", model, key[:12])
+            return _areplay_chunks(content)
+
+    async def open_stream():
+        started = time.perf_counter()
+        # Only opening the stream is retried; chunks already handed out cannot be taken back
+        stream = await api_scheduler.arun(
+            _key_id(client),
+            lambda: client.chat.completions.create(
+                model=model, messages=messages, stream=True, stream_options=STREAM_OPTIONS, **params
+            ),
+        )
+        return _arecord_stream(stream, cache, key, model, started)
+
+    return await _stream_flight.stream(key, open_stream)
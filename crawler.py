@@ -0,0 +1,175 @@
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import zip_longest
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+from fetcher import CRAWL_PER_HOST_CONCURRENCY, FetchError
+from logger import configured_logger
+from pages import PageCache
+from urls import VisitedIndex, canonicalize
+
+load_dotenv()
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "16"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "500"))
+
+
+@dataclass
+class CrawlResult:
+    """
+    Everything a breadth-first crawl discovered, in discovery order.
+    """
+
+    pages: dict = field(default_factory=dict)  # url -> Page for every fetched page
+    links: list = field(default_factory=list)  # Canonical links found on fetched pages, deduplicated
+    anchors: dict = field(default_factory=dict)  # link -> first non-empty anchor text
+    visited: VisitedIndex = field(default_factory=VisitedIndex)  # Every URL seen, fetched or not
+    errors: dict = field(default_factory=dict)  # url -> error for failed fetches
+
+
+class AsyncCrawler:
+    """
+    A breadth-first asynchronous crawler.
+
+    Each depth level is fetched concurrently, bounded by a global concurrency limit,
+    a per-host concurrency limit and an overall page budget. Pages are read from and
+    written to the shared PageCache, so Websites in the same analysis never refetch them.
+
+    Links are canonicalized before they are compared, so a page reached through
+    several spellings (trailing slash, fragment, tracking parameters) or through a
+    redirect is only fetched and expanded once.
+    """
+
+    def __init__(
+        self,
+        max_depth=1,
+        max_pages=CRAWL_MAX_PAGES,
+        concurrency=CRAWL_CONCURRENCY,
+        per_host_concurrency=CRAWL_PER_HOST_CONCURRENCY,
+        page_cache=None,
+    ):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.page_cache = page_cache if page_cache is not None else PageCache()
+
+    async def crawl(self, start_url, start_depth=1):
+        """
+        Crawls from start_url up to max_depth and returns a CrawlResult.
+        """
+        result = CrawlResult()
+        result.visited.add(start_url)
+        expanded = VisitedIndex()  # Final URLs of the pages whose links were followed
+        frontier = [start_url]
+        depth = start_depth
+
+        global_limit = asyncio.Semaphore(self.concurrency)
+        host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host_concurrency))
+
+        while frontier and depth <= self.max_depth:
+            # Respect the page budget across all depth levels
+            budget = self.max_pages - len(result.pages) - len(result.errors)
+            if budget <= 0:
+                configured_logger.info(
+                    "Crawl page budget of %d reached at depth %d", self.max_pages, depth
+                )
+                break
+            batch = frontier[:budget]
+
+            pages = await asyncio.gather(
+                *(self._fetch(url, global_limit, host_limits, result) for url in batch)
+            )
+
+            # Collect the next frontier in page order so link order is deterministic
+            next_frontier = []
+            for url, page in zip(batch, pages):
+                if page is None:
+                    continue
+                if page.final_url:
+                    # Links to the redirect target itself are not fetched again
+                    result.visited.add(page.final_url)
+                if not expanded.add(page.final_url or url):
+                    configured_logger.debug("%s redirected to an already crawled page", url)
+                    del result.pages[url]
+                    if depth > start_depth:
+                        # Only the start URL is not a discovered link
+                        result.links.remove(url)
+                    continue
+                for link, anchor in zip_longest(page.links, page.anchors, fillvalue=""):
+                    try:
+                        link = canonicalize(link)
+                        scheme = urlsplit(link).scheme
+                    except ValueError as link_error:
+                        configured_logger.debug("Skipping invalid link %s: %s", link, link_error)
+                        continue
+                    if scheme not in ("http", "https"):
+                        # mailto:, tel:, ... links cannot be crawled
+                        continue
+                    if anchor and not result.anchors.get(link):
+                        result.anchors[link] = anchor
+                    if result.visited.add(link):
+                        result.links.append(link)
+                        next_frontier.append(link)
+
+            frontier = next_frontier
+            depth += 1
+
+        return result
+
+    async def _fetch(self, url, global_limit, host_limits, result):
+        try:
+            if url in self.page_cache:
+                page = await self.page_cache.aget(url)
+            else:
+                host = urlsplit(url).netloc.lower()
+                async with global_limit, host_limits[host]:
+                    page = await self.page_cache.aget(url)
+        except FetchError as e:
+            configured_logger.error("Error requesting %s: %s", url, e)
+            result.errors[url] = e
+            return None
+
+        result.pages[url] = page
+        return page
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """
+    Return the long-lived event loop used to run crawls for synchronous callers.
+
+    Reusing one loop keeps its pooled async HTTP client (and its keep-alive
+    connections) alive across Website instances.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="crawler-loop", daemon=True
+            ).start()
+        return _loop
+
+
+def run_sync(coroutine):
+    """
+    Runs a coroutine to completion from synchronous code on the background crawl loop.
+
+    This also works when the calling thread already runs an event loop (e.g. a sync
+    helper called from a FastAPI handler), since the coroutine never runs on it.
+    """
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coroutine.close()
+        raise RuntimeError("run_sync() would deadlock the crawl loop; await the async API instead")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
@@ -0,0 +1,139 @@
+import os
+import re
+from dotenv import load_dotenv
+from logger import configured_logger
+from metrics import DEDUP_SAVED_CHARS
+from progress import emit
+
+load_dotenv()
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Runs of this many lines seen together on an earlier page are removed, however short
+DEDUP_SHINGLE_LINES = int(os.getenv("DEDUP_SHINGLE_LINES", "3"))
+# Single lines at least this long are removed when an earlier page had them
+DEDUP_MIN_LINE_CHARS = int(os.getenv("DEDUP_MIN_LINE_CHARS", "40"))
+# Pages whose SimHash differs from an earlier page's in at most this many bits are dropped
+DEDUP_SIMHASH_DISTANCE = int(os.getenv("DEDUP_SIMHASH_DISTANCE", "6"))
+
+SIMHASH_BITS = 64
+HASH_MASK = (1 << SIMHASH_BITS) - 1
+WORD = re.compile(r"\w+")
+
+
+def _normalize(line):
+    return " ".join(line.lower().split())
+
+
+def simhash(text, shingle_words=3):
+    """
+    The 64-bit SimHash of a text over its word shingles: texts that share most of
+    their shingles get hashes that differ in only a few bits.
+    """
+    words = WORD.findall(text.lower())
+    features = {
+        hash(" ".join(words[i:i + shingle_words])) & HASH_MASK
+        for i in range(max(1, len(words) - shingle_words + 1))
+    }
+    # Count the set bits per position over all features, most significant bit first
+    columns = zip(*(format(feature, "064b") for feature in features))
+    threshold = len(features) / 2
+    fingerprint = 0
+    for column in columns:
+        fingerprint = (fingerprint << 1) | ("".join(column).count("1") > threshold)
+    return fingerprint
+
+
+def hamming_distance(first, second):
+    return (first ^ second).bit_count()
+
+
+class ContentDeduplicator:
+    """
+    Removes text an analysis already has from the pages that follow, in prompt order.
+
+    A line is dropped when it is at least DEDUP_MIN_LINE_CHARS long and an earlier
+    page had it, or when it is part of a run of DEDUP_SHINGLE_LINES lines that an
+    earlier page had, which catches navigation, footers and cookie banners made of
+    short lines. A page whose SimHash is within DEDUP_SIMHASH_DISTANCE bits of an
+    earlier page's (e.g. near-identical careers and jobs pages) is dropped entirely.
+    """
+
+    def __init__(
+        self,
+        shingle_lines=DEDUP_SHINGLE_LINES,
+        min_line_chars=DEDUP_MIN_LINE_CHARS,
+        simhash_distance=DEDUP_SIMHASH_DISTANCE,
+    ):
+        self.shingle_lines = shingle_lines
+        self.min_line_chars = min_line_chars
+        self.simhash_distance = simhash_distance
+        self._lines = set()  # Hashes of the lines of earlier pages
+        self._shingles = set()  # Hashes of runs of shingle_lines lines of earlier pages
+        self._simhashes = []
+        self.chars_in = 0
+        self.chars_saved = 0
+        self.lines_removed = 0
+        self.pages_dropped = 0
+
+    def filter(self, url, text):
+        """
+        Return the text of the next page without the content of earlier pages, or
+        None if the whole page is a near-duplicate of one of them.
+        """
+        self.chars_in += len(text)
+        fingerprint = simhash(text)
+        if any(hamming_distance(fingerprint, seen) <= self.simhash_distance for seen in self._simhashes):
+            configured_logger.debug("Dropping near-duplicate page %s", url)
+            self.pages_dropped += 1
+            self.chars_saved += len(text)
+            DEDUP_SAVED_CHARS.inc(len(text), kind="page")
+            return None
+        self._simhashes.append(fingerprint)
+
+        lines = [line for line in text.splitlines() if line.strip()]
+        line_hashes = [hash(_normalize(line)) for line in lines]
+        shingle_hashes = [
+            hash(tuple(line_hashes[i:i + self.shingle_lines]))
+            for i in range(len(lines) - self.shingle_lines + 1)
+        ]
+
+        repeated = [
+            len(line) >= self.min_line_chars and line_hash in self._lines
+            for line, line_hash in zip(lines, line_hashes)
+        ]
+        for i, shingle_hash in enumerate(shingle_hashes):
+            if shingle_hash in self._shingles:
+                repeated[i:i + self.shingle_lines] = [True] * self.shingle_lines
+
+        # Register this page only afterwards, so a page never removes its own lines
+        self._lines.update(line_hashes)
+        self._shingles.update(shingle_hashes)
+
+        kept = [line for line, is_repeated in zip(lines, repeated) if not is_repeated]
+        removed = len(lines) - len(kept)
+        filtered = "\n".join(kept)
+        saved = max(0, len(text) - len(filtered)) if removed else 0
+        self.lines_removed += removed
+        self.chars_saved += saved
+        DEDUP_SAVED_CHARS.inc(saved, kind="block")
+        return filtered if removed else text
+
+    def report(self):
+        """
+        Log (and report as a "dedup" progress event) how many characters
+        deduplication kept out of the prompt.
+        """
+        if self.chars_in:
+            emit(
+                "dedup",
+                chars_in=self.chars_in,
+                chars_saved=self.chars_saved,
+                lines_removed=self.lines_removed,
+                pages_dropped=self.pages_dropped,
+            )
+            configured_logger.info(
+                "Deduplication saved %d of %d characters (%d repeated lines, %d near-duplicate pages)",
+                self.chars_saved,
+                self.chars_in,
+                self.lines_removed,
+                self.pages_dropped,
+            )
@@ -0,0 +1,256 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from logger import configured_logger
+from urls import canonicalize
+
+load_dotenv()
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PAGE_CACHE_FRESH_SECONDS = float(os.getenv("PAGE_CACHE_FRESH_SECONDS", "3600"))  # 1 hour
+PAGE_CACHE_TTL_SECONDS = float(os.getenv("PAGE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))  # 7 days
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # 256MB
+# Eviction frees space down to this fraction of the limit, so it does not run on every store
+PAGE_CACHE_EVICT_TO = 0.9
+
+
+@dataclass
+class CachedPage:
+    """
+    The extracted contents of a page stored on disk, together with its HTTP validators.
+    """
+
+    title: str
+    text: str
+    links: tuple
+    anchors: tuple = ()
+    final_url: str = None
+    etag: str = None
+    last_modified: str = None
+    stored_at: float = 0.0
+
+    def is_fresh(self, fresh_seconds=PAGE_CACHE_FRESH_SECONDS):
+        """
+        Whether the page can be served without revalidating it with the origin.
+        """
+        return time.time() - self.stored_at < fresh_seconds
+
+    def conditional_headers(self):
+        """
+        Headers for a conditional GET that lets the origin answer 304 Not Modified.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class DiskPageCache:
+    """
+    A persistent page cache backed by a single SQLite file.
+
+    Each row holds the raw body, the extracted title/text/links and the ETag and
+    Last-Modified validators, keyed by the canonical URL, as the in-memory PageCache is.
+    Once the total size exceeds max_bytes, entries that have not been (re)validated
+    within the TTL are evicted first, then the least recently used ones. The total is
+    kept as a running count, summed from the table only when the cache is opened.
+    """
+
+    def __init__(
+        self,
+        path=os.path.join(CACHE_DIR, "pages.sqlite"),
+        ttl_seconds=PAGE_CACHE_TTL_SECONDS,
+        max_bytes=PAGE_CACHE_MAX_BYTES,
+    ):
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    body BLOB,
+                    title TEXT,
+                    text TEXT,
+                    links TEXT,
+                    anchors TEXT,
+                    final_url TEXT
+                )
+                """
+            )
+            # Caches created before anchor text and redirects were stored lack the columns
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(pages)")}
+            for column in ("anchors", "final_url"):
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE pages ADD COLUMN {column} TEXT")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS pages_stored_at ON pages (stored_at)"
+            )
+            self._total_bytes = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM pages"
+            ).fetchone()[0]
+
+    def lookup(self, url):
+        """
+        Return the CachedPage for a URL, or None if it is missing or expired.
+        """
+        url = canonicalize(url)
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT etag, last_modified, stored_at, title, text, links, anchors, final_url, size"
+                " FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            etag, last_modified, stored_at, title, text, links, anchors, final_url, size = row
+            if now - stored_at >= self.ttl_seconds:
+                self._connection.execute("DELETE FROM pages WHERE url = ?", (url,))
+                self._total_bytes -= size
+                return None
+            self._connection.execute(
+                "UPDATE pages SET accessed_at = ? WHERE url = ?", (now, url)
+            )
+
+        links = tuple(json.loads(links))
+        return CachedPage(
+            title=title,
+            text=text,
+            links=links,
+            anchors=tuple(json.loads(anchors)) if anchors else ("",) * len(links),
+            final_url=final_url,
+            etag=etag,
+            last_modified=last_modified,
+            stored_at=stored_at,
+        )
+
+    def store(self, url, page, body, headers):
+        """
+        Store a freshly downloaded and parsed page, then enforce the size limit.
+        """
+        url = canonicalize(url)
+        now = time.time()
+        links = json.dumps(list(page.links))
+        anchors = json.dumps(list(page.anchors))
+        size = len(body) + len(page.text.encode("utf-8")) + len(links) + len(anchors)
+        with self._lock, self._connection:
+            replaced = self._connection.execute(
+                "SELECT size FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            self._connection.execute(
+                """
+                INSERT OR REPLACE INTO pages
+                    (url, etag, last_modified, stored_at, accessed_at, size, body, title, text, links, anchors,
+                     final_url)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    url,
+                    headers.get("etag"),
+                    headers.get("last-modified"),
+                    now,
+                    now,
+                    size,
+                    body,
+                    page.title,
+                    page.text,
+                    links,
+                    anchors,
+                    page.final_url,
+                ),
+            )
+            self._total_bytes += size - (replaced[0] if replaced else 0)
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def revalidated(self, url):
+        """
+        Mark a page as fresh again after the origin answered 304 Not Modified.
+        """
+        url = canonicalize(url)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE pages SET stored_at = ?, accessed_at = ? WHERE url = ?",
+                (now, now, url),
+            )
+
+    def evict(self):
+        """
+        Drop expired entries, then least recently used ones until the cache is back
+        under PAGE_CACHE_EVICT_TO of max_bytes.
+        """
+        with self._lock, self._connection:
+            cutoff = time.time() - self.ttl_seconds
+            expired_bytes, expired = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM pages WHERE stored_at < ?", (cutoff,)
+            ).fetchone()
+            if expired:
+                self._connection.execute("DELETE FROM pages WHERE stored_at < ?", (cutoff,))
+                self._total_bytes -= expired_bytes
+
+            evicted = 0
+            target = self.max_bytes * PAGE_CACHE_EVICT_TO
+            if self._total_bytes > target:
+                # Walks the accessed_at index, stopping as soon as enough space is freed
+                rows = self._connection.execute(
+                    "SELECT url, size FROM pages ORDER BY accessed_at ASC"
+                )
+                victims = []
+                for url, size in rows:
+                    if self._total_bytes <= target:
+                        break
+                    victims.append((url,))
+                    self._total_bytes -= size
+                self._connection.executemany("DELETE FROM pages WHERE url = ?", victims)
+                evicted = len(victims)
+
+        if expired or evicted:
+            configured_logger.info(
+                "Page cache evicted %d expired and %d least recently used pages", expired, evicted
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_disk_cache():
+    """
+    Return the process-wide DiskPageCache, or None when PAGE_CACHE_ENABLED is off.
+    """
+    global _disk_cache
+    if not PAGE_CACHE_ENABLED:
+        return None
+    with _disk_cache_lock:
+        if _disk_cache is None:
+            _disk_cache = DiskPageCache()
+        return _disk_cache
@@ -0,0 +1,274 @@
+import codecs
+import os
+import re
+from abc import ABC
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+from logger import configured_logger
+
+try:
+    from lxml import etree
+except ImportError:  # The streaming extractor is used instead
+    etree = None
+
+load_dotenv()
+# One of "auto", "lxml", "streaming" or "soup"
+HTML_EXTRACTOR = os.getenv("HTML_EXTRACTOR", "auto").lower()
+
+DEFAULT_TITLE = "No title found"
+SKIPPED_TAGS = ("script", "style")
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([a-zA-Z0-9_\-]+)""", re.I)
+
+
+def resolve_link(base_url, href):
+    """
+    Turn an href into a full URL, or None for empty, javascript and fragment links
+    and hrefs that are not valid URLs (e.g. "//[oops/x").
+    """
+    href = (href or "").strip()
+
+    # Skip empty or javascript links
+    if not href or href.startswith(("javascript:", "#")):
+        return None
+
+    try:
+        # Ensure href is a full URL
+        if href.startswith(("http://", "https://")):
+            urlsplit(href)  # Rejects malformed hosts such as "http://[::1/"
+            return href
+        return urljoin(base_url, href)
+    except ValueError as link_error:
+        configured_logger.debug("Skipping invalid link %s on %s: %s", href, base_url, link_error)
+        return None
+
+
+def decode_html(body):
+    """
+    Decode an HTML body using its BOM or <meta charset>, falling back to UTF-8.
+    """
+    if isinstance(body, str):
+        return body
+    for bom, encoding in (
+        (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"),
+        (codecs.BOM_UTF16_BE, "utf-16"),
+    ):
+        if body.startswith(bom):
+            return body.decode(encoding, errors="replace")
+
+    match = META_CHARSET.search(body[:2048])
+    if match:
+        try:
+            return body.decode(match.group(1).decode("ascii"), errors="replace")
+        except LookupError:
+            pass
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        return body.decode("cp1252", errors="replace")
+
+
+class HtmlExtractor(ABC):
+    """
+    Extracts the title, visible body text and links of an HTML page.
+    """
+
+    name = None
+
+    def extract(self, url, body):
+        """
+        Return a (title, text, links, anchors) tuple for a raw HTML body, where
+        anchors holds the anchor text of each link.
+        """
+        raise NotImplementedError("Subclasses should implement this!")
+
+
+class _ExtractionTarget:
+    """
+    Event handler shared by the tree-less extractors.
+
+    Text runs are flushed at every tag boundary and stripped, which matches
+    BeautifulSoup's get_text(separator="\\n", strip=True) over the body.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.title = None
+        self.links = []
+        self._link_index = {}  # url -> position in links
+        self._anchors = []  # Anchor text parts, one list per link
+        self._anchor = None  # Parts of the anchor being read, if any
+        self._lines = []
+        self._run = []
+        self._in_title = False
+        self._title_parts = []
+        self._in_body = False
+        self._skip_depth = 0
+
+    def _flush(self):
+        if self._run:
+            text = "".join(self._run).strip()
+            self._run = []
+            if text and self._in_body and not self._skip_depth:
+                self._lines.append(text)
+
+    def start(self, tag, attrs):
+        self._flush()
+        tag = tag.lower()
+        if tag == "body":
+            self._in_body = True
+        elif tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "a" and "href" in attrs:
+            full_url = resolve_link(self.url, attrs.get("href"))
+            if full_url:
+                index = self._link_index.get(full_url)
+                if index is None:
+                    index = self._link_index[full_url] = len(self.links)
+                    self.links.append(full_url)
+                    self._anchors.append([])
+                # Keep the first non-empty anchor text of a link
+                self._anchor = self._anchors[index] if not self._anchors[index] else None
+
+    def end(self, tag):
+        self._flush()
+        tag = tag.lower()
+        if tag == "body":
+            self._in_body = False
+        elif tag == "a":
+            self._anchor = None
+        elif tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts).strip()
+
+    def data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+        if self._anchor is not None:
+            self._anchor.append(data)
+        self._run.append(data)
+
+    def close(self):
+        self._flush()
+        if self._in_title:
+            self.title = "".join(self._title_parts).strip()
+        anchors = tuple(" ".join(" ".join(parts).split()) for parts in self._anchors)
+        return (self.title or DEFAULT_TITLE, "\n".join(self._lines), tuple(self.links), anchors)
+
+
+class _StreamingParser(HTMLParser):
+    def __init__(self, target):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.target.start(tag, dict(attrs))
+        self.target.end(tag)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+
+class StreamingExtractor(HtmlExtractor):
+    """
+    A single pass over the document with the standard library's HTMLParser; no tree
+    is built.
+    """
+
+    name = "streaming"
+
+    def extract(self, url, body):
+        target = _ExtractionTarget(url)
+        parser = _StreamingParser(target)
+        parser.feed(decode_html(body))
+        parser.close()
+        return target.close()
+
+
+class LxmlExtractor(HtmlExtractor):
+    """
+    A single pass with lxml's C parser feeding parser-target events; no tree is built.
+    """
+
+    name = "lxml"
+
+    def extract(self, url, body):
+        if not body:
+            return DEFAULT_TITLE, "", (), ()
+        target = _ExtractionTarget(url)
+        parser = etree.HTMLParser(target=target)
+        try:
+            parser.feed(body)
+            return parser.close()
+        except etree.LxmlError as e:
+            configured_logger.warning("lxml could not parse %s (%s), retrying with HTMLParser", url, e)
+            return StreamingExtractor().extract(url, body)
+
+
+class SoupExtractor(HtmlExtractor):
+    """
+    The original BeautifulSoup extraction, kept as a fallback.
+    """
+
+    name = "soup"
+
+    def extract(self, url, body):
+        soup = BeautifulSoup(body, "html.parser")
+
+        # Extract the title of the page
+        title = DEFAULT_TITLE
+        if soup.title and soup.title.string:
+            title = soup.title.string.strip()
+
+        # Extract all anchor tags before the body is cleaned up
+        links = []
+        anchors = {}
+        for anchor in soup.find_all("a", href=True):
+            full_url = resolve_link(url, anchor.get("href", ""))
+            if full_url and full_url not in anchors:
+                links.append(full_url)
+                anchors[full_url] = ""
+            if full_url and not anchors[full_url]:
+                anchors[full_url] = " ".join(anchor.get_text(" ").split())
+
+        # Clean and extract text from the body (excluding irrelevant tags)
+        text = ""
+        if soup.body:
+            for irrelevant in soup.body(["script", "style", "img", "input"]):
+                irrelevant.decompose()
+            text = soup.body.get_text(separator="\n", strip=True)
+
+        return title, text, tuple(links), tuple(anchors[link] for link in links)
+
+
+EXTRACTORS = {
+    StreamingExtractor.name: StreamingExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+    SoupExtractor.name: SoupExtractor,
+}
+
+
+def get_extractor(name=HTML_EXTRACTOR):
+    """
+    Return the configured extractor; "auto" prefers lxml and falls back to streaming.
+    """
+    if name == "auto":
+        name = LxmlExtractor.name if etree is not None else StreamingExtractor.name
+    if name == LxmlExtractor.name and etree is None:
+        configured_logger.warning("lxml is not installed, using the streaming HTML extractor")
+        name = StreamingExtractor.name
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown HTML extractor '{name}', expected one of {sorted(EXTRACTORS)}")
+    return EXTRACTORS[name]()
@@ -0,0 +1,336 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+import httpx
+from dotenv import load_dotenv
+from logger import configured_logger
+from metrics import FETCH_BYTES, FETCHES, STAGE_SECONDS
+from robots import robots_crawl_delay
+from scheduler import SCHEDULER_MAX_KEYS, SCHEDULER_MAX_WAIT_SECONDS, Scheduler, parse_retry_after
+from singleflight import SingleFlight
+
+load_dotenv()
+FETCH_HTTP2 = os.getenv("FETCH_HTTP2", "true").lower() in ("1", "true", "yes")
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "5"))
+FETCH_READ_TIMEOUT = float(os.getenv("FETCH_READ_TIMEOUT", "15"))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(2 * 1024 * 1024)))  # 2MB
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "100"))
+FETCH_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("FETCH_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Concurrent requests per site, shared by crawls; the scheduler lowers it for sites
+# that slow down or answer 429/5xx, and raises it back up to this value
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "4"))
+# Opt-in pacing per site in requests per second (0 = unlimited unless robots.txt sets a Crawl-delay)
+FETCH_HOST_RATE = float(os.getenv("FETCH_HOST_RATE", "0"))
+FETCH_HOST_BURST = float(os.getenv("FETCH_HOST_BURST", "16"))
+# Read robots.txt before the first fetch from a site and honor its Crawl-delay
+FETCH_RESPECT_CRAWL_DELAY = os.getenv("FETCH_RESPECT_CRAWL_DELAY", "true").lower() in ("1", "true", "yes")
+ROBOTS_CACHE_SECONDS = float(os.getenv("ROBOTS_CACHE_SECONDS", "3600"))  # 1 hour
+ROBOTS_MAX_BYTES = 512 * 1024
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+# Answers that mean "try again later" rather than "this page is broken"
+RETRYABLE_STATUS_CODES = (408, 429, 502, 503, 504)
+
+try:
+    import h2  # noqa: F401 -- httpx only needs it to be importable
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class FetchError(Exception):
+    """
+    Raised when a page cannot be fetched (network error, bad status or unsupported content).
+    """
+
+
+@dataclass
+class FetchResponse:
+    """
+    A fully read (and possibly truncated) page download.
+    """
+
+    url: str  # Final URL after redirects
+    status_code: int
+    headers: dict = field(default_factory=dict)
+    body: bytes = b""
+    truncated: bool = False
+
+
+def _client_options():
+    return dict(
+        http2=FETCH_HTTP2 and HTTP2_AVAILABLE,
+        follow_redirects=True,
+        timeout=httpx.Timeout(
+            FETCH_READ_TIMEOUT, connect=FETCH_CONNECT_TIMEOUT, pool=FETCH_CONNECT_TIMEOUT
+        ),
+        limits=httpx.Limits(
+            max_connections=FETCH_MAX_CONNECTIONS,
+            max_keepalive_connections=FETCH_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+    )
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+
+def get_client():
+    """
+    Return the process-wide pooled, keep-alive client used for synchronous fetches.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(**_client_options())
+        return _client
+
+
+def get_async_client():
+    """
+    Return the pooled async client for the running event loop.
+
+    httpx async connections are bound to the loop that opened them, so each loop gets
+    its own client (in practice the server loop and the background crawl loop).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(**_client_options())
+        _async_clients[loop] = client
+    return client
+
+
+def _check_content_type(response):
+    content_type = response.headers.get("content-type", "")
+    mime_type = content_type.split(";", 1)[0].strip().lower()
+    if mime_type and mime_type not in HTML_CONTENT_TYPES:
+        FETCHES.inc(outcome="skipped")
+        raise FetchError(f"Unsupported content type '{mime_type}'")
+
+
+def _to_fetch_response(response, body, truncated):
+    if truncated:
+        configured_logger.warning(
+            "Truncated %s at the %d byte download cap", response.url, FETCH_MAX_BYTES
+        )
+    FETCHES.inc(outcome="not_modified" if response.status_code == 304 else "ok")
+    FETCH_BYTES.inc(len(body))
+    return FetchResponse(
+        url=str(response.url),
+        status_code=response.status_code,
+        headers=dict(response.headers),
+        body=bytes(body),
+        truncated=truncated,
+    )
+
+
+def _classify(error):
+    """
+    Whether a failed fetch is worth retrying, and the delay the site asked for.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        if error.response.status_code in RETRYABLE_STATUS_CODES:
+            return True, parse_retry_after(error.response.headers)
+        return False, None
+    if isinstance(error, httpx.ConnectError):
+        # DNS failures and refused connections do not go away in a few seconds
+        return False, None
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)), None
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+def _honor_crawl_delay(origin, robots, bucket):
+    delay = robots_crawl_delay(robots)
+    if delay:
+        configured_logger.info("Honoring a Crawl-delay of %.1fs for %s", delay, origin)
+        bucket.slow_down(1 / min(delay, SCHEDULER_MAX_WAIT_SECONDS))
+
+
+def _apply_crawl_delay(origin, bucket):
+    _honor_crawl_delay(origin, fetch_robots(origin), bucket)
+
+
+async def _aapply_crawl_delay(origin, bucket):
+    _honor_crawl_delay(origin, await afetch_robots(origin), bucket)
+
+
+# Paces, bounds and retries page downloads per site
+host_scheduler = Scheduler(
+    "fetch",
+    _classify,
+    rate=FETCH_HOST_RATE,
+    burst=FETCH_HOST_BURST,
+    concurrency=CRAWL_PER_HOST_CONCURRENCY,
+    max_concurrency=CRAWL_PER_HOST_CONCURRENCY,
+    prepare=_apply_crawl_delay if FETCH_RESPECT_CRAWL_DELAY else None,
+    aprepare=_aapply_crawl_delay if FETCH_RESPECT_CRAWL_DELAY else None,
+)
+
+
+def fetch(url, headers=None, max_bytes=None):
+    """
+    Streams a page through the shared client, stopping at the byte cap.
+
+    Non-HTML responses are rejected from their headers, before the body is read.
+    A 304 Not Modified answer to a conditional request is returned with an empty body.
+    Requests are paced per site, and timeouts, connection errors and 429/5xx answers
+    are retried with backoff (honoring Retry-After).
+    """
+    max_bytes = FETCH_MAX_BYTES if max_bytes is None else max_bytes
+
+    def attempt():
+        with get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                # Conditional GET: the caller's cached copy is still valid
+                return _to_fetch_response(response, b"", False)
+            response.raise_for_status()
+            _check_content_type(response)
+            body = bytearray()
+            truncated = False
+            for chunk in response.iter_bytes():
+                body += chunk
+                if len(body) >= max_bytes:
+                    del body[max_bytes:]
+                    truncated = True
+                    break
+            return _to_fetch_response(response, body, truncated)
+
+    try:
+        with STAGE_SECONDS.time(stage="fetch"):
+            return host_scheduler.run(_origin(url), attempt)
+    except httpx.HTTPError as e:
+        FETCHES.inc(outcome="error")
+        raise FetchError(f"{e.__class__.__name__}: {e}") from e
+
+
+async def afetch(url, headers=None, max_bytes=None):
+    """
+    Async counterpart of fetch(), using the pooled client of the running loop. The
+    number of concurrent requests per site also adapts to its latency and errors,
+    and a robots.txt Crawl-delay is honored.
+    """
+    max_bytes = FETCH_MAX_BYTES if max_bytes is None else max_bytes
+
+    async def attempt():
+        async with get_async_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                # Conditional GET: the caller's cached copy is still valid
+                return _to_fetch_response(response, b"", False)
+            response.raise_for_status()
+            _check_content_type(response)
+            body = bytearray()
+            truncated = False
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) >= max_bytes:
+                    del body[max_bytes:]
+                    truncated = True
+                    break
+            return _to_fetch_response(response, body, truncated)
+
+    try:
+        with STAGE_SECONDS.time(stage="fetch"):
+            return await host_scheduler.arun(_origin(url), attempt)
+    except httpx.HTTPError as e:
+        FETCHES.inc(outcome="error")
+        raise FetchError(f"{e.__class__.__name__}: {e}") from e
+
+
+_robots_flight = SingleFlight("robots")
+_robots = OrderedDict()  # origin -> (robots.txt text, fetched_at)
+_robots_lock = threading.Lock()
+
+
+def _cached_robots(origin):
+    with _robots_lock:
+        cached = _robots.get(origin)
+        if cached and time.time() - cached[1] < ROBOTS_CACHE_SECONDS:
+            return cached[0]
+    return None
+
+
+def _remember_robots(origin, body):
+    text = bytes(body[:ROBOTS_MAX_BYTES]).decode("utf-8", errors="replace")
+    with _robots_lock:
+        _robots[origin] = (text, time.time())
+        while len(_robots) > SCHEDULER_MAX_KEYS:
+            _robots.popitem(last=False)
+    return text
+
+
+def fetch_robots(origin):
+    """
+    Return the robots.txt of a site ("" if it has none), cached for ROBOTS_CACHE_SECONDS.
+    """
+    text = _cached_robots(origin)
+    if text is not None:
+        return text
+    body = bytearray()
+    try:
+        with get_client().stream("GET", f"{origin}/robots.txt") as response:
+            if response.status_code == 200:
+                for chunk in response.iter_bytes():
+                    body += chunk
+                    if len(body) >= ROBOTS_MAX_BYTES:
+                        break
+    except httpx.HTTPError as e:
+        configured_logger.debug("Could not read robots.txt of %s: %s", origin, e)
+        body = bytearray()
+    return _remember_robots(origin, body)
+
+
+async def afetch_robots(origin):
+    """
+    Async counterpart of fetch_robots(); concurrent reads of one site are coalesced.
+    """
+    text = _cached_robots(origin)
+    if text is not None:
+        return text
+
+    async def read():
+        body = bytearray()
+        try:
+            async with get_async_client().stream("GET", f"{origin}/robots.txt") as response:
+                if response.status_code == 200:
+                    async for chunk in response.aiter_bytes():
+                        body += chunk
+                        if len(body) >= ROBOTS_MAX_BYTES:
+                            break
+        except httpx.HTTPError as e:
+            configured_logger.debug("Could not read robots.txt of %s: %s", origin, e)
+            body = bytearray()
+        return _remember_robots(origin, body)
+
+    return await _robots_flight.do(origin, read)
+
+
+def close_clients():
+    """
+    Close the shared synchronous client.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def aclose_async_client():
+    """
+    Close the pooled async client of the running loop, if one was opened.
+    """
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
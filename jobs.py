@@ -0,0 +1,281 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+from completion_cache import acached_stream
+from disk_cache import CACHE_DIR
+from logger import configured_logger
+from main import MODEL, SummaryOutputStrategy, aprepare_summary
+from metrics import span, trace
+from openai_clients import client_pool
+from singleflight import Broadcast
+
+load_dotenv()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(CACHE_DIR, "jobs.sqlite"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))  # 7 days
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class JobFailed(Exception):
+    """
+    Raised to the followers of a job's output when the job failed partway.
+    """
+
+
+class JobStore:
+    """
+    Persists job status and completed results in SQLite.
+
+    API keys are never written to disk, so a job that was still queued or running
+    when the process stopped cannot be resumed; it is marked failed on startup.
+    """
+
+    def __init__(self, path=JOB_DB_PATH, retention_seconds=JOB_RETENTION_SECONDS):
+        db_dir = os.path.dirname(path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    company_name TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    model TEXT,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+
+    def create(self, job_id, company_name, url, model):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO jobs (id, company_name, url, model, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, company_name, url, model, QUEUED, time.time()),
+            )
+
+    def started(self, job_id):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                (RUNNING, time.time(), job_id),
+            )
+
+    def finished(self, job_id, result=None, error=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (COMPLETED if error is None else FAILED, result, error, time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        """
+        Return the job's row as a dict, or None for an unknown job.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def recover(self):
+        """
+        Fail the jobs an earlier process left unfinished and drop expired ones.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            interrupted = self._connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?)",
+                (FAILED, "Interrupted by a server restart", now, QUEUED, RUNNING),
+            ).rowcount
+            expired = self._connection.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (now - self.retention_seconds,),
+            ).rowcount
+        if interrupted or expired:
+            configured_logger.info(
+                "Job store marked %d interrupted jobs failed and removed %d expired jobs",
+                interrupted,
+                expired,
+            )
+
+
+class LiveJob(Broadcast):
+    """
+    The in-memory output of a queued or running job, which clients can follow.
+    """
+
+    def __init__(self, job_id, company_name, url, client, model):
+        super().__init__()
+        self.id = job_id
+        self.company_name = company_name
+        self.url = url
+        self.client = client
+        self.model = model
+
+
+class JobOutputStrategy(SummaryOutputStrategy):
+    """
+    Streams the summary into a LiveJob instead of an HTTP response or terminal.
+    """
+
+    def __init__(self, job):
+        super().__init__(client=job.client, model=job.model)
+        self.job = job
+
+    async def handle_output(self, messages):
+        stream = await acached_stream(client_pool.ensure_async(self.client), self.model, messages)
+        with span("summary_stream", model=self.model):
+            async for content in stream:
+                self.job.append(content)
+        return "".join(self.job.parts)
+
+
+class JobQueue:
+    """
+    Runs submitted analyses on a pool of background workers.
+
+    Submitting returns a job ID right away. While a job is queued or running its
+    output lives in memory, where clients can follow it from any offset; completed
+    results are persisted in the JobStore and replayed from there.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, store=None):
+        self.workers = workers
+        self._store = store
+        self._queue = None
+        self._tasks = []
+        self._live = {}  # job id -> LiveJob
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = JobStore()
+        return self._store
+
+    async def start(self):
+        """
+        Start the worker pool on the running loop; calling it again is a no-op.
+        """
+        if self._tasks:
+            return
+        await asyncio.to_thread(self.store.recover)
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}") for i in range(self.workers)
+        ]
+        configured_logger.info("Started %d job workers", self.workers)
+
+    async def stop(self):
+        """
+        Cancel the workers; unfinished jobs are marked failed on the next start.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, company_name, url, api_key=None, model=None):
+        """
+        Queue an analysis and return its job ID.
+        """
+        await self.start()
+        model = model or MODEL
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.create, job_id, company_name, url, model)
+        job = LiveJob(job_id, company_name, url, client_pool.get_async(api_key), model)
+        self._live[job_id] = job
+        await self._queue.put(job)
+        return job_id
+
+    async def status(self, job_id):
+        """
+        Return the job's status, or None for an unknown job. `length` is the number
+        of characters of output produced so far.
+        """
+        record = await asyncio.to_thread(self.store.get, job_id)
+        if record is None:
+            return None
+        job = self._live.get(job_id)
+        result = record.pop("result")
+        record["length"] = job.length if job is not None else len(result or "")
+        if record["status"] == COMPLETED:
+            record["result"] = result
+        return record
+
+    async def stream(self, job_id, offset=0):
+        """
+        Yield the job's output from character `offset` on, following it live while it
+        runs. Raises KeyError for an unknown job, and JobFailed once the output of a
+        job that failed partway has been yielded, so it is never mistaken for complete.
+        """
+        job = self._live.get(job_id)
+        if job is not None:
+            async for content in job.follow(offset):
+                yield content
+            return
+
+        record = await asyncio.to_thread(self.store.get, job_id)
+        if record is None:
+            raise KeyError(job_id)
+        if record["result"] and offset < len(record["result"]):
+            yield record["result"][offset:]
+        if record["status"] == FAILED:
+            raise JobFailed(record["error"])
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        result = error = failure = None
+        with trace(job.id), span("job", url=job.url):
+            try:
+                await asyncio.to_thread(self.store.started, job.id)
+                prepared = await aprepare_summary(
+                    job.company_name, job.url, client=job.client, model=job.model
+                )
+                if prepared.summary is not None:
+                    job.append(prepared.summary)
+                    result = prepared.summary
+                else:
+                    result = await JobOutputStrategy(job).handle_output(prepared.messages)
+                    await prepared.save(result)
+            except Exception as e:
+                configured_logger.error("Job %s (%s) failed: %s", job.id, job.url, e)
+                # Some exceptions (e.g. asyncio.TimeoutError()) have no message
+                error = str(e) or e.__class__.__name__
+                failure = JobFailed(error)
+                # Keep the partial output, so followers resuming from the store get
+                # the same output and the same error as those following it live
+                result = "".join(job.parts) or None
+
+            # Persist before dropping the live copy, so clients never see a gap
+            await asyncio.to_thread(self.store.finished, job.id, result, error)
+            job.finish(failure)
+            self._live.pop(job.id, None)
+
+
+# Shared queue instance, started in the server lifespan
+job_queue = JobQueue()
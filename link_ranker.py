@@ -0,0 +1,167 @@
+import os
+import re
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit, urlunsplit
+from dotenv import load_dotenv
+
+load_dotenv()
+LINK_RANKER_ENABLED = os.getenv("LINK_RANKER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Candidates sent to the link-selection LLM call
+LINK_RANKER_TOP_K = int(os.getenv("LINK_RANKER_TOP_K", "30"))
+# Confidence at which the local selection is used without calling the LLM. Off by
+# default ("inf"): keyword matches alone are not reliable enough to replace the model.
+# 1.0 skips the call only when every core section has a strong match.
+LINK_RANKER_SKIP_LLM_CONFIDENCE = float(os.getenv("LINK_RANKER_SKIP_LLM_CONFIDENCE", "inf"))
+
+# Page sections worth summarizing, with their weight and the words that identify them
+SECTIONS = {
+    "about": (3.0, ("about", "about-us", "aboutus", "company", "who-we-are", "story", "mission")),
+    "careers": (3.0, ("careers", "career", "jobs", "job", "join-us", "hiring", "work-with-us")),
+    "customers": (2.5, ("customers", "customer", "clients", "case-studies", "case-study", "testimonials")),
+    "team": (2.0, ("team", "leadership", "people", "founders", "management")),
+    "culture": (2.0, ("culture", "values", "life-at")),
+    "products": (1.5, ("products", "product", "solutions", "services", "platform", "features")),
+    "investors": (1.5, ("investors", "investor-relations", "ir")),
+    "news": (1.0, ("news", "press", "newsroom", "media", "blog")),
+    "partners": (1.0, ("partners", "partner")),
+}
+# Sections whose confident presence lets the LLM call be skipped
+CORE_SECTIONS = ("about", "careers", "customers")
+
+EXCLUDED_WORDS = {
+    "privacy", "terms", "tos", "legal", "cookie", "cookies", "login", "signin", "sign-in",
+    "signup", "sign-up", "register", "cart", "checkout", "account", "search", "tag", "feed",
+    "rss", "sitemap", "unsubscribe", "gdpr", "disclaimer",
+}
+ASSET_EXTENSIONS = (
+    ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".css", ".js", ".json", ".xml",
+    ".zip", ".gz", ".mp4", ".mp3", ".woff", ".woff2", ".ttf", ".pdf",
+)
+WORD_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+@dataclass(frozen=True)
+class RankedLink:
+    url: str
+    anchor: str = ""
+    section: str = None  # Best matching SECTIONS key, if any
+    score: float = 0.0
+    strong: bool = False  # The section was matched by a whole path segment
+
+
+@dataclass
+class LinkRanking:
+    """
+    The deduplicated, scored same-site links of a website, best first.
+    """
+
+    candidates: list = field(default_factory=list)  # RankedLink, at most top_k
+    dropped: int = 0  # Links removed as duplicates, off-site, assets or excluded
+    confidence: float = 0.0  # Share of CORE_SECTIONS with a strong candidate
+
+    def selection(self):
+        """
+        The local selection in the link-selection response format: the best strong
+        candidate of each section.
+        """
+        best = {}
+        for link in self.candidates:
+            if link.strong and link.section not in best:
+                best[link.section] = link
+        return {"links": [{"type": f"{link.section} page", "url": link.url} for link in best.values()]}
+
+
+def _site(hostname):
+    hostname = (hostname or "").lower()
+    return hostname[4:] if hostname.startswith("www.") else hostname
+
+
+def _dedupe_key(parts):
+    # Query-string, fragment and trailing-slash variants are the same page for ranking
+    return (_site(parts.hostname), parts.path.rstrip("/").lower() or "/")
+
+
+def _match_section(words, phrase):
+    best = None
+    for section, (weight, keywords) in SECTIONS.items():
+        # Multi-word keywords (about-us, case-studies) are matched against the whole phrase
+        if any(keyword in words or ("-" in keyword and keyword in phrase) for keyword in keywords):
+            if best is None or weight > SECTIONS[best][0]:
+                best = section
+    return best
+
+
+def score_link(parts, anchor):
+    """
+    Score one link from its path keywords and anchor text. Returns a
+    (section, score, strong) tuple; excluded links score None.
+    """
+    segments = [segment for segment in parts.path.lower().split("/") if segment]
+    segment_words = set()
+    for segment in segments:
+        segment_words.add(segment)
+        segment_words.update(word for word in WORD_SPLIT.split(segment) if word)
+    anchor_words = set(word for word in WORD_SPLIT.split(anchor.lower()) if word)
+
+    if (segment_words | anchor_words) & EXCLUDED_WORDS:
+        return None, None, False
+
+    path_section = _match_section(segment_words, "/".join(segments))
+    anchor_section = _match_section(anchor_words, "-".join(anchor_words))
+    section = path_section or anchor_section
+    if section is None:
+        # Unclassified same-site pages rank below every recognized section
+        return None, 1.0 / (1 + len(segments)), False
+
+    weight = SECTIONS[section][0]
+    score = weight * (1.0 if path_section else 0.8)
+    if path_section and anchor_section == path_section:
+        score += 0.5
+    # Prefer section roots (/about) over deep pages (/about/press/2019/...)
+    score += 1.0 / (1 + len(segments))
+    return section, score, path_section is not None
+
+
+def rank_links(base_url, links, anchors=None, top_k=LINK_RANKER_TOP_K):
+    """
+    Dedupe and score the links of a website and keep the top_k same-site candidates.
+
+    Links are dropped when they are not http(s), point off-site (subdomains count as
+    the same site), are assets, match an excluded word (privacy, login, ...) or only
+    differ from an earlier link by query string, fragment or trailing slash.
+    """
+    anchors = anchors or {}
+    base_parts = urlsplit(base_url)
+    site = _site(base_parts.hostname)
+    landing = _dedupe_key(base_parts)
+
+    seen = {landing}
+    ranked = []
+    dropped = 0
+    for link in links:
+        parts = urlsplit(link)
+        host = _site(parts.hostname)
+        key = _dedupe_key(parts)
+        if (
+            parts.scheme not in ("http", "https")
+            or not (host == site or host.endswith("." + site))
+            or key in seen
+            or parts.path.lower().endswith(ASSET_EXTENSIONS)
+        ):
+            dropped += 1
+            continue
+        seen.add(key)
+
+        anchor = anchors.get(link, "")
+        section, score, strong = score_link(parts, anchor)
+        if score is None:
+            dropped += 1
+            continue
+        url = urlunsplit((parts.scheme, parts.netloc, parts.path or "/", parts.query, ""))
+        ranked.append(RankedLink(url, anchor, section, score, strong))
+
+    # Stable sort keeps the site's own link order among equal scores
+    ranked.sort(key=lambda link: link.score, reverse=True)
+    strong_sections = {link.section for link in ranked if link.strong}
+    confidence = sum(section in strong_sections for section in CORE_SECTIONS) / len(CORE_SECTIONS)
+    return LinkRanking(candidates=ranked[:top_k], dropped=dropped, confidence=confidence)
@@ -1,11 +1,34 @@
 import os
+import atexit
+import json
 import logging
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from dotenv import load_dotenv
+
+load_dotenv()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+SPAN_LOG_FILE = os.getenv("SPAN_LOG_FILE", "web_summarizer.spans.log")
+
+
+def _start_queue_listener(logger, handlers):
+    """
+    Attach a QueueHandler to the logger and write its records to the handlers from
+    a background thread, so callers never block on console or disk I/O.
+    """
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
 
 
 def setup_logger(
-    name="web_summarizer", log_file="web_summarizer.log", level=logging.INFO
+    name="web_summarizer", log_file="web_summarizer.log", level=LOG_LEVEL
 ):
     """
     Create a comprehensive logger with multiple handlers.
@@ -14,6 +37,7 @@ def setup_logger(
     - Console output
     - File logging with rotation
     - Structured logging
+    - Non-blocking: records are queued and written by a background listener
     """
     # Ensure log directory exists
     log_dir = os.path.dirname(log_file)
@@ -45,12 +69,50 @@ def setup_logger(
     )
     file_handler.setFormatter(file_formatter)
 
-    # Add handlers to logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Hand both handlers to the background listener
+    _start_queue_listener(logger, (console_handler, file_handler))
+
+    return logger
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line, merging in its `fields` extra.
+    """
+
+    def format(self, record):
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def setup_json_logger(name="web_summarizer.spans", log_file=SPAN_LOG_FILE, level=logging.INFO):
+    """
+    Create a logger that writes structured JSON lines (e.g. timing spans) to a
+    rotating file, separately from the human-readable logs.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.handlers.clear()
+    # Keep JSON records out of the console and text log handlers
+    logger.propagate = False
+
+    file_handler = RotatingFileHandler(
+        log_file, maxBytes=10 * 1024 * 1024, backupCount=5  # 10MB
+    )
+    file_handler.setFormatter(JsonFormatter())
+    _start_queue_listener(logger, (file_handler,))
 
     return logger
 
 
-# logger instance
+# logger instances
 configured_logger = setup_logger()
+span_logger = setup_json_logger()
@@ -1,21 +1,49 @@
+import asyncio
 import json
+import logging
 import os
+import time
 from abc import ABC
 from io import StringIO
-from urllib.parse import urljoin
-import requests
 from IPython.display import Markdown, display
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from openai import OpenAI
 from rich.console import Console
 from rich.markdown import Markdown
+from analysis_store import content_hash, get_analysis_store, link_set_hash
+from completion_cache import (
+    _key_id,
+    acached_completion,
+    cached_completion,
+    cached_stream,
+    invalidate_completion,
+)
+from crawler import AsyncCrawler, run_sync
+from dedup import DEDUP_ENABLED, ContentDeduplicator
+from fetcher import FetchError
+from link_ranker import LINK_RANKER_ENABLED, LINK_RANKER_SKIP_LLM_CONFIDENCE, rank_links
 from logger import configured_logger
+from metrics import CACHE_LOOKUPS, span, trace
+from openai_clients import client_pool
+from pages import PageCache
+from progress import emit
+from prompt_budget import (
+    PromptAssembler,
+    count_tokens,
+    prompt_token_budget,
+    split_to_tokens,
+    truncate_to_tokens,
+)
+from renderer import LiveMarkdownRenderer
+from sitemaps import LINK_DISCOVERY, discover_sitemap_links
+from urls import VisitedIndex
 from prompt import (
     user_prompt_for_relevant_links,
     system_prompt_for_summary,
     system_prompt_for_relevant_links,
     user_prompt_for_summary,
+    system_prompt_for_page_summary,
+    user_prompt_for_page_summary,
+    user_prompt_for_combined_summary,
 )
 
 load_dotenv()
@@ -23,6 +51,16 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL = os.getenv("MODEL")
 COMPANY_NAME = os.getenv("COMPANY_NAME")
 URL = os.getenv("WEBSITE_URL")
+RELEVANT_PAGE_WORKERS = int(os.getenv("RELEVANT_PAGE_WORKERS", "8"))
+RELEVANT_PAGES_TIMEOUT = float(os.getenv("RELEVANT_PAGES_TIMEOUT", "60"))
+# "single" truncates every page into one summary prompt; "map_reduce" summarizes the
+# pages separately and combines the partial summaries
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "single").lower()
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))  # Page summaries in flight
+MAP_REDUCE_CHUNK_TOKENS = int(os.getenv("MAP_REDUCE_CHUNK_TOKENS", "3000"))
+MAP_REDUCE_MAX_PAGE_TOKENS = int(os.getenv("MAP_REDUCE_MAX_PAGE_TOKENS", "24000"))
+# Sections this short are passed to the final call as they are
+MAP_REDUCE_MIN_SECTION_TOKENS = int(os.getenv("MAP_REDUCE_MIN_SECTION_TOKENS", "256"))
 
 if API_KEY and API_KEY.startswith("sk-proj-") and len(API_KEY) > 10:
     configured_logger.info("API key looks good so far")
@@ -31,161 +69,160 @@ else:
         "There might be a problem with your API key, it is not prefixed with 'sk-proj-'"
     )
 
-openai = OpenAI()
-
 
 def log_content_summarizer(func):
 
     def wrapper(*args, **kwargs):
         try:
             configured_logger.info(
-                f"Attempting to summarize web content for {COMPANY_NAME}: {URL}"
+                "Attempting to summarize web content for %s: %s", COMPANY_NAME, URL
             )
             result = func(*args, **kwargs)
             configured_logger.info(
-                f"Successfully summarized web content for {COMPANY_NAME}: {URL}"
+                "Successfully summarized web content for %s: %s", COMPANY_NAME, URL
             )
             return result
         except Exception as e:
             configured_logger.error(
-                f"Error summarizing web content for {COMPANY_NAME}: {URL} --> Error: {e}"
+                "Error summarizing web content for %s: %s --> Error: %s", COMPANY_NAME, URL, e
             )
             raise
 
     return wrapper
 
 
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-
-
 class Website:
     """
     A utility class to represent a Website that we have scraped, now with links.
     """
 
-    def __init__(self, url, max_depth=1):
-        self.url = url
-        self.visited = []  # Track visited URLs
-        self.links = []  # Store links
-        self.title = "No title found"  # Default title
-        self.text = ""  # Default text content
-        self.max_depth = max_depth  # Maximum depth for recursion
+    def __init__(self, url, max_depth=1, page_cache=None):
+        self._setup(url, max_depth, page_cache)
 
         try:
             self.initialize(url)  # Fetch and parse the page
             self.scrape(url, 1)  # Start scraping at depth 1
         except Exception as e:
-            print(f"Website initialization error: {e}")
+            configured_logger.error("Website initialization error: %s", e)
             # Optionally, you can re-raise or handle differently
             raise
 
+    @classmethod
+    async def create(cls, url, max_depth=1, page_cache=None, discovery="crawl"):
+        """
+        Async constructor: builds a Website without blocking the running event loop.
+
+        With discovery="sitemap" the links come from the site's sitemaps instead of
+        its HTML, falling back to the crawl when it publishes none.
+        """
+        website = cls.__new__(cls)
+        website._setup(url, max_depth, page_cache)
+
+        try:
+            await website.ainitialize(url)
+            if not (discovery == "sitemap" and await website.adiscover(url)):
+                await website.ascrape(url, 1)
+        except Exception as e:
+            configured_logger.error("Website initialization error: %s", e)
+            raise
+        return website
+
+    def _setup(self, url, max_depth, page_cache):
+        self.url = url
+        self.visited = VisitedIndex()  # Track visited URLs
+        self.links = []  # Store links
+        self.anchors = {}  # link -> anchor text
+        self.title = "No title found"  # Default title
+        self.text = ""  # Default text content
+        self.max_depth = max_depth  # Maximum depth for recursion
+        # Pages are fetched and parsed once, and shared with other Websites using the same cache
+        self.page_cache = page_cache if page_cache is not None else PageCache()
+
     def initialize(self, url):
         """
-        Initializes the BeautifulSoup object, title, and text before scraping.
+        Initializes the title and text from the (cached) parsed page before scraping.
+        """
+        try:
+            self._apply_page(self.page_cache.get(url))
+        except FetchError as e:
+            configured_logger.warning("Error initializing %s: %s", url, e)
+
+    async def ainitialize(self, url):
+        """
+        Async counterpart of initialize().
         """
         try:
-            # Fetch the content of the page
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an exception for bad responses (404, etc.)
-            body = response.content
-            soup = BeautifulSoup(body, "html.parser")
-
-            # Extract the title of the page
-            if soup.title:
-                self.title = soup.title.string.strip()
-
-            # Clean and extract text from the body (excluding irrelevant tags)
-            if soup.body:
-                for irrelevant in soup.body(["script", "style", "img", "input"]):
-                    irrelevant.decompose()
-                self.text = soup.body.get_text(separator="\n", strip=True)
-            else:
-                self.text = ""
-        except requests.exceptions.RequestException as e:
-            print(f"Error initializing {url}: {e}")
+            self._apply_page(await self.page_cache.aget(url))
+        except FetchError as e:
+            configured_logger.warning("Error initializing %s: %s", url, e)
+
+    def _apply_page(self, page):
+        self.title = page.title
+        self.text = page.text
 
     def scrape(self, url, depth):
         """
-        Scrapes the website, extracts links recursively up to the maximum depth.
+        Scrapes the website breadth-first with the async crawler, up to the maximum depth.
+        """
+        run_sync(self.ascrape(url, depth))
+
+    async def ascrape(self, url, depth):
+        """
+        Async counterpart of scrape().
         """
         # Avoid revisiting the same URL
         if url in self.visited:
             return
 
-        # Mark the current URL as visited
-        self.visited.append(url)
+        configured_logger.debug("Scraping %s at depth %d", url, depth)
 
-        # Stop recursion if maximum depth is reached
-        if depth > self.max_depth:
-            return
+        crawler = AsyncCrawler(max_depth=self.max_depth, page_cache=self.page_cache)
+        with span("crawl", url=url) as fields:
+            result = await crawler.crawl(url, start_depth=depth)
+            fields.update(pages=len(result.pages), links=len(result.links), errors=len(result.errors))
 
-        print(depth, url)
+        self.visited.update(result.visited)
+        self.links.extend(result.links)
+        for link, anchor in result.anchors.items():
+            self.anchors.setdefault(link, anchor)
 
-        try:
-            # Fetch the content of the page
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an exception for bad responses (404, etc.)
-            body = response.content
-            soup = BeautifulSoup(body, "html.parser")
-
-            # Extract all anchor tags (links)
-            links = soup.find_all("a", href=True)  # Only find links with href attribute
-
-            # Carefully process links
-            processed_links = []
-            for link in links:
-                try:
-                    # Get href as a string explicitly
-                    href = link.get('href', '').strip()
-
-                    # Skip empty or javascript links
-                    if not href or href.startswith(('javascript:', '#')):
-                        continue
-
-                    # Ensure href is a full URL
-                    if href.startswith(('http://', 'https://')):
-                        full_url = href
-                    else:
-                        full_url = urljoin(url, href)
-
-                    # Optional: Add some filtering criteria
-                    if full_url not in processed_links and full_url not in self.visited:
-                        processed_links.append(full_url)
-
-                except Exception as link_error:
-                    print(f"Error processing individual link {link}: {link_error}")
-                    continue
-
-            self.links.extend(processed_links)
-
-            # Recursively scrape all links at the next depth level
-            for link in processed_links:
-                self.scrape(link, depth + 1)
-
-        except requests.exceptions.RequestException as e:
+        for failed_url, error in result.errors.items():
             # Handle request exceptions (e.g., network issues, invalid URLs)
-            print(f"Error requesting {url}: {e}")
-
+            configured_logger.warning("Error requesting %s: %s", failed_url, error)
 
-    def get_contents(self):
+    async def adiscover(self, url):
+        """
+        Collects the links listed in the site's sitemaps; returns False if there are none.
+        """
+        links = await discover_sitemap_links(url)
+        for link in links:
+            if self.visited.add(link):
+                self.links.append(link)
+        configured_logger.debug("Discovered %d sitemap links for %s", len(links), url)
+        return bool(links)
+
+    def get_contents(self, deduplicator=None):
         """
         Return the title and contents of the website as a formatted string.
+
+        With a ContentDeduplicator, content of the pages it saw before is left out,
+        and None is returned if the page is a near-duplicate of one of them.
         """
         try:
             # Ensure title and text are strings
             title = str(self.title) if self.title else "No Title"
             text = str(self.text) if self.text else "No Content"
+            if deduplicator is not None:
+                text = deduplicator.filter(self.url, text)
+                if text is None:
+                    return None
 
             # Add extra debug information
-            print(f"DEBUG: Webpage title: {title}")
-            print(f"DEBUG: Webpage text length: {len(text)}")
+            configured_logger.debug("Webpage title: %s, text length: %d", title, len(text))
 
             return f"Webpage Title:\n{title}\nWebpage Contents:\n{text}\n\n"
         except Exception as e:
-            print(f"DEBUG: get_contents error: {e}")
-            print(traceback.format_exc())
+            configured_logger.error("get_contents error: %s", e, exc_info=True)
             return f"Error fetching webpage contents: {e}"
 
     def get_all_links(self):
@@ -195,159 +232,518 @@ class Website:
         return self.links
 
 
-def get_links_user_prompt(website):
-    """Generate a user prompt with website links."""
-    links_str = "\n".join(website.links) if website.links else "No links found"
+def get_links_user_prompt(website, links=None):
+    """Generate a user prompt with website links (or only the given candidate links)."""
+    links = website.links if links is None else links
+    links_str = "\n".join(links) if links else "No links found"
     return f"Website URL: {website.url}\n\nLinks found:\n{links_str}"
 
 
-def get_relevant_links(url):
+def get_relevant_links(url, page_cache=None, client=None, model=None):
     """
     Fetches relevant links from the given URL using the OpenAI API.
+    Pass the analysis' page_cache to reuse pages that were already fetched, and the
+    tenant's OpenAI client and model (both default to the environment settings).
     """
+    return run_sync(
+        aget_relevant_links(url, page_cache=page_cache, client=client, model=model)
+    )
+
+
+async def aget_relevant_links(url, page_cache=None, client=None, model=None):
+    """
+    Async counterpart of get_relevant_links(), using AsyncOpenAI.
+
+    With INCREMENTAL_ANALYSIS on, the selection of the previous analysis of the url
+    with the same API key is reused as long as the site's link set is unchanged.
+    """
+    client = client_pool.ensure_async(client)
+    model = model or MODEL
     try:
-        website = Website(url)
+        website = await Website.create(url, page_cache=page_cache, discovery=LINK_DISCOVERY)
 
         # Log the links found
-        print(f"DEBUG: Total links found: {len(website.links)}")
-        configured_logger.info(f"Total links found: {len(website.links)}")
-
-        response = openai.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt_for_relevant_links},
-                {"role": "user", "content": get_links_user_prompt(website)},
-            ],
-            response_format={"type": "json_object"},
-        )
+        configured_logger.info("Total links found: %d", len(website.links))
+
+        store = get_analysis_store()
+        if store is None:
+            return await _aselect_links(url, website, client, model)
+
+        links_hash = link_set_hash(website.links)
+        stored = await asyncio.to_thread(store.get, _key_id(client), url, model)
+        reused = stored is not None and stored.links_hash == links_hash and stored.selection is not None
+        CACHE_LOOKUPS.inc(cache="link_selection", result="hit" if reused else "miss")
+        if reused:
+            configured_logger.info("Link set of %s is unchanged, reusing the previous selection", url)
+            return stored.selection
+        selection = await _aselect_links(url, website, client, model)
+        await asyncio.to_thread(store.save_links, _key_id(client), url, model, links_hash, selection)
+        return selection
 
-        result = response.choices[0].message.content
+    except Exception as e:
+        configured_logger.error("Error in get_relevant_links: %s", e, exc_info=True)
+        raise
 
-        # Extensive logging
-        print(f"DEBUG: Raw API response: {result}")
-        configured_logger.info(f"Raw API response: {result}")
 
-        try:
-            parsed_links = json.loads(result)
-            print(f"DEBUG: Parsed links: {parsed_links}")
-            configured_logger.info(f"Parsed links: {parsed_links}")
+async def _aselect_links(url, website, client, model):
+    """
+    Selects the relevant links of a Website, locally or with the model.
+    """
+    candidates = None
+    if LINK_RANKER_ENABLED:
+        # Rank locally first: only the best candidates go to the model, and a
+        # confident local selection skips the call altogether
+        with span("link_ranking", links=len(website.links)) as fields:
+            ranking = rank_links(url, website.links, website.anchors)
+            fields.update(candidates=len(ranking.candidates), confidence=ranking.confidence)
+        if ranking.confidence >= LINK_RANKER_SKIP_LLM_CONFIDENCE:
+            selection = ranking.selection()
+            configured_logger.info(
+                "Selected %d links locally (confidence %.2f), skipping the LLM call",
+                len(selection["links"]),
+                ranking.confidence,
+            )
+            return selection
+        candidates = [link.url for link in ranking.candidates]
+
+    messages = [
+        {"role": "system", "content": system_prompt_for_relevant_links},
+        {"role": "user", "content": get_links_user_prompt(website, candidates)},
+    ]
+    response_format = {"type": "json_object"}
+
+    # Unchanged link lists reuse the previous selection instead of a new completion
+    with span("link_selection", model=model, links=len(candidates if candidates is not None else website.links)):
+        result = await acached_completion(
+            client, model, messages, response_format=response_format
+        )
 
-            # Validate the structure
-            if not isinstance(parsed_links, dict) or 'links' not in parsed_links:
-                raise ValueError("Invalid links structure")
+    try:
+        parsed_links = json.loads(result)
+        # The payloads can be large, so they are only logged at debug level
+        if configured_logger.isEnabledFor(logging.DEBUG):
+            configured_logger.debug("Raw API response: %s", result)
+            configured_logger.debug("Parsed links: %s", parsed_links)
 
-            return parsed_links
+        # Validate the structure
+        if not isinstance(parsed_links, dict) or 'links' not in parsed_links:
+            raise ValueError("Invalid links structure")
 
-        except json.JSONDecodeError as json_err:
-            print(f"DEBUG: JSON Parsing Error: {json_err}")
-            configured_logger.error(f"JSON Parsing Error: {json_err}")
-            raise
-        except ValueError as val_err:
-            print(f"DEBUG: Links Validation Error: {val_err}")
-            configured_logger.error(f"Links Validation Error: {val_err}")
-            raise
+        return parsed_links
 
-    except Exception as e:
-        print(f"DEBUG: Error in get_relevant_links: {e}")
-        print(traceback.format_exc())
-        configured_logger.error(f"Error in get_relevant_links: {str(e)}")
+    except json.JSONDecodeError as json_err:
+        await asyncio.to_thread(
+            invalidate_completion, client, model, messages, response_format=response_format
+        )
+        configured_logger.error("JSON Parsing Error: %s", json_err)
+        raise
+    except ValueError as val_err:
+        await asyncio.to_thread(
+            invalidate_completion, client, model, messages, response_format=response_format
+        )
+        configured_logger.error("Links Validation Error: %s", val_err)
         raise
-import traceback
 
 
-def get_content_from_relevant_links(url):
+
+async def fetch_link_website(link_url, page_cache):
     """
-    Fetches the content from the landing page and relevant links.
+    Fetches the Website of one relevant link.
     """
-    try:
-        # Extra debug logging
-        print("DEBUG: Entering get_content_from_relevant_links")
-        configured_logger.info("DEBUG: Entering get_content_from_relevant_links")
+    configured_logger.debug("Processing link: %s", link_url)
 
-        # Create result as a list for safe concatenation
-        result = []
+    with span("relevant_page", url=link_url):
+        return await Website.create(link_url, page_cache=page_cache)
 
-        # Fetch and log landing page contents
-        try:
-            landing_page = Website(url)
-            print(f"DEBUG: Landing page title: {landing_page.title}")
-            configured_logger.info(f"DEBUG: Landing page title: {landing_page.title}")
-
-            landing_contents = landing_page.get_contents()
-            result.append(str(landing_contents))
-        except Exception as landing_page_error:
-            print(f"DEBUG: Landing page error: {landing_page_error}")
-            configured_logger.error(f"Landing page error: {landing_page_error}")
-            result.append("Could not fetch landing page contents")
-
-        # Debug relevant links
-        try:
-            links = get_relevant_links(url)
-            print(f"DEBUG: Raw links: {links}")
-            configured_logger.info(f"DEBUG: Raw links: {links}")
-        except Exception as links_error:
-            print(f"DEBUG: Links retrieval error: {links_error}")
-            configured_logger.error(f"Links retrieval error: {links_error}")
-            return "Could not retrieve relevant links"
-
-        # Validate links structure
-        if not isinstance(links, dict) or 'links' not in links:
-            error_msg = f"Invalid links structure: {links}"
-            print(f"DEBUG: {error_msg}")
-            configured_logger.error(error_msg)
-            return error_msg
-
-        # Process each link
-        for link in links.get('links', []):
-            try:
-                # Validate link structure
-                if not isinstance(link, dict) or 'url' not in link:
-                    print(f"DEBUG: Skipping invalid link: {link}")
-                    configured_logger.warning(f"Skipping invalid link: {link}")
-                    continue
 
-                link_url = link['url']
-                link_type = link.get('type', 'Unknown Type')
+async def fetch_link_contents(link_url, page_cache):
+    """
+    Fetches the formatted contents of one relevant link.
+    """
+    link_website = await fetch_link_website(link_url, page_cache)
+    return str(link_website.get_contents())
 
-                print(f"DEBUG: Processing link: {link_url}")
-                configured_logger.info(f"Processing link: {link_url}")
 
-                # Fetch link contents
-                link_website = Website(link_url)
-                result.append(f"\n\n{str(link_type)}")
-                result.append(str(link_website.get_contents()))
+async def iter_content_from_relevant_links(
+    url, client=None, model=None, page_cache=None, link_selector=None, page_hashes=None
+):
+    """
+    Lazily yields the landing page and relevant link contents, in priority order.
+
+    Each item is a (section, sections_left) pair. Relevant pages are fetched
+    concurrently, but only RELEVANT_PAGE_WORKERS pages ahead of the consumer, so
+    closing the generator stops any further fetches.
 
+    Analyses of the same site can share a page_cache and a link_selector (a
+    replacement for aget_relevant_links with the same signature), as batches do.
+
+    Unless DEDUP_ENABLED is off, text already in an earlier section (navigation,
+    footers, ...) is left out of the later ones, and near-duplicate pages are skipped.
+
+    A page_hashes dict receives the content hash of every page read, by URL.
+    """
+    configured_logger.debug("Entering get_content_from_relevant_links")
+
+    # One cache for the whole analysis, so each URL is downloaded and parsed only once
+    page_cache = page_cache if page_cache is not None else PageCache()
+    link_selector = link_selector or aget_relevant_links
+    deduplicator = ContentDeduplicator() if DEDUP_ENABLED else None
+
+    # Fetch and log landing page contents
+    try:
+        with span("landing_page", url=url):
+            landing_page = await Website.create(url, page_cache=page_cache)
+        configured_logger.debug("Landing page title: %s", landing_page.title)
+        if page_hashes is not None:
+            page_hashes[url] = _page_hash(landing_page)
+
+        landing_contents = str(landing_page.get_contents(deduplicator))
+    except Exception as landing_page_error:
+        configured_logger.error("Landing page error: %s", landing_page_error)
+        landing_contents = "Could not fetch landing page contents"
+
+    # Debug relevant links
+    try:
+        links = await link_selector(
+            url, page_cache=page_cache, client=client, model=model
+        )
+        configured_logger.debug("Raw links: %s", links)
+    except Exception as links_error:
+        configured_logger.error("Links retrieval error: %s", links_error)
+        yield landing_contents, 1
+        yield "Could not retrieve relevant links", 0
+        return
+
+    # Validate links structure
+    if not isinstance(links, dict) or 'links' not in links:
+        error_msg = f"Invalid links structure: {links}"
+        configured_logger.error(error_msg)
+        yield landing_contents, 1
+        yield error_msg, 0
+        return
+
+    # Validate every link first, keeping the LLM's order
+    relevant_links = []
+    for link in links.get('links', []):
+        if not isinstance(link, dict) or 'url' not in link:
+            configured_logger.warning("Skipping invalid link: %s", link)
+            continue
+        relevant_links.append(link)
+    emit("links", links=relevant_links)
+
+    yield landing_contents, len(relevant_links)
+
+    # Fetch relevant pages concurrently, a bounded window ahead of the consumer
+    tasks = []
+
+    def schedule_up_to(index):
+        for i in range(len(tasks), min(index, len(relevant_links))):
+            tasks.append(
+                asyncio.create_task(
+                    fetch_link_website(relevant_links[i]['url'], page_cache)
+                )
+            )
+
+    try:
+        schedule_up_to(RELEVANT_PAGE_WORKERS)
+        deadline = time.monotonic() + RELEVANT_PAGES_TIMEOUT
+        for i, link in enumerate(relevant_links):
+            link_url = link['url']
+            link_type = link.get('type', 'Unknown Type')
+            try:
+                link_website = await asyncio.wait_for(
+                    tasks[i], timeout=max(0, deadline - time.monotonic())
+                )
+                if page_hashes is not None:
+                    page_hashes[link_url] = _page_hash(link_website)
+                # Deduplicated in prompt order, so earlier (more relevant) pages keep their text
+                contents = link_website.get_contents(deduplicator)
+            except asyncio.TimeoutError:
+                configured_logger.error("Link processing timed out: %s", link_url)
+                continue
             except Exception as link_error:
-                print(f"DEBUG: Link processing error: {link_error}")
-                print(traceback.format_exc())
-                configured_logger.error(f"Link processing error: {link_error}")
-                configured_logger.error(traceback.format_exc())
+                configured_logger.error("Link processing error: %s", link_error, exc_info=True)
+                continue
+            finally:
+                schedule_up_to(i + 1 + RELEVANT_PAGE_WORKERS)
+
+            if contents is None:
+                configured_logger.info("Skipping near-duplicate page: %s", link_url)
                 continue
+            yield f"\n\n{str(link_type)}\n{contents}", len(relevant_links) - i - 1
+    finally:
+        # Never wait for a hung or unneeded page
+        for task in tasks:
+            task.cancel()
+        if deduplicator is not None:
+            deduplicator.report()
+
+
+def _page_hash(website):
+    return content_hash(f"{website.title}\n{website.text}")
+
+
+def get_content_from_relevant_links(url, client=None, model=None):
+    """
+    Fetches the content from the landing page and relevant links.
+    """
+    return run_sync(aget_content_from_relevant_links(url, client=client, model=model))
 
+
+async def aget_content_from_relevant_links(url, client=None, model=None):
+    """
+    Async counterpart of get_content_from_relevant_links().
+    """
+    try:
         # Join and return results
-        final_result = "\n".join(result)
-        print(f"DEBUG: Final result length: {len(final_result)}")
-        configured_logger.info(f"DEBUG: Final result length: {len(final_result)}")
+        final_result = "\n".join(
+            [
+                section
+                async for section, _ in iter_content_from_relevant_links(
+                    url, client=client, model=model
+                )
+            ]
+        )
+        configured_logger.debug("Final result length: %d", len(final_result))
 
         return final_result
 
     except Exception as e:
-        print(f"DEBUG: Comprehensive error: {e}")
-        print(traceback.format_exc())
-        configured_logger.error(f"Comprehensive error: {e}")
-        configured_logger.error(traceback.format_exc())
+        configured_logger.error("Comprehensive error: %s", e, exc_info=True)
         raise
 
-def get_summary_user_prompt(company_name, url):
-    prompt = user_prompt_for_summary.format(
-        company_name=company_name
-    ) + get_content_from_relevant_links(url)
-    user_prompt = prompt[:20_000]  # Truncate if more than 20,000 characters
-    return user_prompt
+
+def get_summary_user_prompt(company_name, url, client=None, model=None, mode=None):
+    """
+    Builds the summary prompt within the model's token budget, fetching relevant
+    pages only until the budget is used up.
+    """
+    return run_sync(
+        aget_summary_user_prompt(company_name, url, client=client, model=model, mode=mode)
+    )
+
+
+async def aget_summary_user_prompt(
+    company_name,
+    url,
+    client=None,
+    model=None,
+    page_cache=None,
+    link_selector=None,
+    mode=None,
+    sections=None,
+):
+    """
+    Async counterpart of get_summary_user_prompt(); page_cache and link_selector are
+    passed on to iter_content_from_relevant_links(), unless the (section,
+    sections_left) pairs were already collected and are passed as sections.
+
+    In "map_reduce" mode (SUMMARY_MODE unless a mode is given) the prompt holds
+    partial summaries of the pages instead of their truncated contents.
+    """
+    model = model or MODEL
+    if sections is not None:
+        sections = _areplay_sections(sections)
+    else:
+        sections = iter_content_from_relevant_links(
+            url,
+            client=client,
+            model=model,
+            page_cache=page_cache,
+            link_selector=link_selector,
+        )
+    assembler = PromptAssembler(prompt_token_budget(model), model)
+
+    if (mode or SUMMARY_MODE) == "map_reduce":
+        with span("map_summaries", url=url, model=model) as fields:
+            partials = await amap_section_summaries(company_name, sections, client=client, model=model)
+            fields["partials"] = len(partials)
+        with span("content_assembly", url=url, model=model) as fields:
+            prompt = assembler.assemble(
+                user_prompt_for_combined_summary.format(company_name=company_name),
+                ((partial, len(partials) - i - 1) for i, partial in enumerate(partials)),
+            )
+            fields["prompt_chars"] = len(prompt)
+    else:
+        with span("content_assembly", url=url, model=model) as fields:
+            prompt = await assembler.aassemble(
+                user_prompt_for_summary.format(company_name=company_name), sections
+            )
+            fields["prompt_chars"] = len(prompt)
+
+    emit(
+        "prompt",
+        chars=len(prompt),
+        tokens=assembler.used_tokens,
+        sections=assembler.sections_used,
+        truncated=assembler.sections_truncated,
+    )
+    return prompt
+
+
+async def _areplay_sections(sections):
+    for section in sections:
+        yield section
+
+
+class PreparedSummary:
+    """
+    The messages of a summary completion or, when INCREMENTAL_ANALYSIS found nothing
+    changed since the last analysis, that analysis' summary (and no messages).
+    """
+
+    def __init__(self, url, model, messages=None, summary=None, pages=None, summary_key=None, key_id=None):
+        self.url = url
+        self.model = model
+        self.key_id = key_id  # The API key ID the summary is stored for
+        self.messages = messages
+        self.summary = summary
+        self.pages = pages
+        self.summary_key = summary_key
+
+    async def save(self, summary):
+        """
+        Store the summary generated from the messages for the next refresh.
+        """
+        store = get_analysis_store()
+        if store is not None and self.summary_key is not None and summary:
+            await asyncio.to_thread(
+                store.save_summary, self.key_id, self.url, self.model, self.pages, self.summary_key, summary
+            )
+
+
+async def aprepare_summary(
+    company_name, url, client=None, model=None, page_cache=None, link_selector=None, mode=None
+):
+    """
+    Builds the summary completion messages for a URL, like aget_summary_user_prompt().
+
+    With INCREMENTAL_ANALYSIS on, every relevant page is read first (pages in the page
+    cache are only revalidated) and hashed. If the pages, company name and mode are the
+    same as in the last analysis of the url with the same API key, its stored summary
+    is returned instead and no prompt is built. Otherwise the changed pages are logged;
+    in "map_reduce" mode the page summaries of the unchanged ones come from the
+    completion cache, so only the affected sections are summarized again.
+    """
+    model = model or MODEL
+    store = get_analysis_store()
+    if store is None:
+        prompt = await aget_summary_user_prompt(
+            company_name,
+            url,
+            client=client,
+            model=model,
+            page_cache=page_cache,
+            link_selector=link_selector,
+            mode=mode,
+        )
+        return PreparedSummary(url, model, messages=summary_messages(prompt))
+
+    pages = {}
+    sections = [
+        section
+        async for section in iter_content_from_relevant_links(
+            url,
+            client=client,
+            model=model,
+            page_cache=page_cache,
+            link_selector=link_selector,
+            page_hashes=pages,
+        )
+    ]
+    if url not in pages:
+        # Without the landing page there is nothing worth storing or comparing
+        prompt = await aget_summary_user_prompt(
+            company_name, url, client=client, model=model, mode=mode, sections=sections
+        )
+        return PreparedSummary(url, model, messages=summary_messages(prompt))
+
+    summary_key = content_hash(
+        json.dumps([company_name, mode or SUMMARY_MODE, sorted(pages.items())], ensure_ascii=False)
+    )
+    key_id = _key_id(client_pool.ensure_async(client))
+    stored = await asyncio.to_thread(store.get, key_id, url, model)
+    reused = stored is not None and stored.summary is not None and stored.summary_key == summary_key
+    CACHE_LOOKUPS.inc(cache="analysis", result="hit" if reused else "miss")
+    if reused:
+        configured_logger.info("No page of %s changed, reusing the previous summary", url)
+        emit("unchanged", pages=len(pages))
+        return PreparedSummary(url, model, summary=stored.summary)
+    if stored is not None and stored.summary is not None:
+        changed = stored.changed_pages(pages)
+        configured_logger.info("%d pages of %s changed since the last analysis", len(changed), url)
+        emit("changed", pages=changed)
+
+    prompt = await aget_summary_user_prompt(
+        company_name, url, client=client, model=model, mode=mode, sections=sections
+    )
+    return PreparedSummary(
+        url, model, messages=summary_messages(prompt), pages=pages, summary_key=summary_key, key_id=key_id
+    )
+
+
+def summary_messages(prompt):
+    return [
+        {"role": "system", "content": system_prompt_for_summary},
+        {"role": "user", "content": prompt},
+    ]
+
+
+async def amap_section_summaries(company_name, sections, client=None, model=None):
+    """
+    The map step of map-reduce summarization: summarizes every section of an async
+    generator of (section, sections_left) pairs and returns the partial summaries in
+    section order.
+
+    Long sections are split into MAP_REDUCE_CHUNK_TOKENS chunks and short ones are
+    kept as they are. At most MAP_REDUCE_CONCURRENCY completions are in flight, and
+    they start while later pages are still being fetched. Page summaries go through
+    the completion cache, so only pages that changed are summarized again.
+    """
+    client = client_pool.ensure_async(client)
+    model = model or MODEL
+    limit = asyncio.Semaphore(MAP_REDUCE_CONCURRENCY)
+    header = user_prompt_for_page_summary.format(company_name=company_name)
+
+    async def summarize(chunk):
+        messages = [
+            {"role": "system", "content": system_prompt_for_page_summary},
+            {"role": "user", "content": header + chunk},
+        ]
+        async with limit:
+            return await acached_completion(client, model, messages)
+
+    parts = []  # Sections kept as they are, or tasks summarizing a chunk
+    try:
+        async for section, _ in sections:
+            if count_tokens(section, model) <= MAP_REDUCE_MIN_SECTION_TOKENS:
+                parts.append(section)
+                continue
+            section = truncate_to_tokens(section, MAP_REDUCE_MAX_PAGE_TOKENS, model)
+            for chunk in split_to_tokens(section, MAP_REDUCE_CHUNK_TOKENS, model):
+                parts.append(asyncio.create_task(summarize(chunk)))
+
+        partials = []
+        for part in parts:
+            if isinstance(part, str):
+                partials.append(part)
+                continue
+            try:
+                partials.append(await part)
+            except Exception as e:
+                configured_logger.error("Page summary error: %s", e)
+        if parts and not partials:
+            raise RuntimeError("Every page summary failed")
+        return partials
+    finally:
+        await sections.aclose()
+        for part in parts:
+            if not isinstance(part, str):
+                part.cancel()
 
 
 def generate_summary(company_name, url):
-    response = openai.chat.completions.create(
+    response = client_pool.get().chat.completions.create(
         model=MODEL,
         messages=[
             {"role": "system", "content": system_prompt_for_summary},
@@ -359,6 +755,11 @@ def generate_summary(company_name, url):
 
 
 class SummaryOutputStrategy(ABC):
+    def __init__(self, client=None, model=None):
+        # The tenant's OpenAI client and model; None means the environment defaults
+        self.client = client
+        self.model = model or MODEL
+
     def handle_output(self, messages):
         raise NotImplementedError("Subclasses should implement this!")
 
@@ -367,15 +768,14 @@ class StandardOutputStrategy(SummaryOutputStrategy):
     def handle_output(self, messages):
         try:
             # Attempt to send the request to OpenAI API
-            response = openai.chat.completions.create(
-                model=MODEL,
-                messages=messages,
-            )
+            with span("summary", model=self.model):
+                result = cached_completion(
+                    self.client or client_pool.get(), self.model, messages
+                )
 
             # Initialize rich console for dynamic output
             console = Console()
 
-            result = response.choices[0].message.content
             console.print(Markdown(result))
 
         except Exception as e:
@@ -388,32 +788,16 @@ class StandardOutputStrategy(SummaryOutputStrategy):
 class StreamingOutputStrategy(SummaryOutputStrategy):
     def handle_output(self, messages):
         try:
-            # Initialize the OpenAI API stream
-            stream = openai.chat.completions.create(
-                model=MODEL,
-                messages=messages,
-                stream=True,
-            )
-
-            # Initialize rich console for dynamic output
-            console = Console()
-            response = ""
-
-            # Process the stream in chunks and display incrementally
-            for chunk in stream:
-                content = chunk.choices[0].delta.content or ""
-                response += content
+            # Initialize the OpenAI API stream (replayed from the cache on a hit)
+            stream = cached_stream(self.client or client_pool.get(), self.model, messages)
 
-                response = str(response)
+            # Accumulate chunks and redraw at a capped frame rate; Markdown is rendered once
+            renderer = LiveMarkdownRenderer(Console())
+            with span("summary_stream", model=self.model), renderer:
+                for content in stream:
+                    renderer.feed(content)
 
-                # Clean markdown artifacts (if needed)
-                response = response.replace("```", "").replace("markdown", "")
-
-                # Display the output dynamically in the console using rich Markdown
-                console.clear()  # Optional: Clears the screen to update in place
-                console.print(Markdown(response))  # Print as rich markdown
-
-            return response
+            return renderer.text
 
         except Exception as e:
             # Log and raise an error with the updated message format
@@ -425,14 +809,30 @@ from io import StringIO
 
 
 class SummaryGenerator:
-    def __init__(self, output_strategy: SummaryOutputStrategy):
+    def __init__(self, output_strategy: SummaryOutputStrategy, mode=None):
         self.output_strategy = output_strategy
+        # "single" or "map_reduce"; defaults to SUMMARY_MODE
+        self.mode = mode
 
     @log_content_summarizer
     def create_summary(self, company_name, url):
+        # One trace ID per analysis, shared by every stage's span
+        with trace(), span("analysis", url=url):
+            self._create_summary(company_name, url)
+
+    def _create_summary(self, company_name, url):
         messages = [
             {"role": "system", "content": system_prompt_for_summary},
-            {"role": "user", "content": get_summary_user_prompt(company_name, url)},
+            {
+                "role": "user",
+                "content": get_summary_user_prompt(
+                    company_name,
+                    url,
+                    client=self.output_strategy.client,
+                    model=self.output_strategy.model,
+                    mode=self.mode,
+                ),
+            },
         ]
 
         self.output_strategy.handle_output(messages)
@@ -0,0 +1,257 @@
+import bisect
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logger import span_logger
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A named metric with a fixed set of label names.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """
+        Yield (name, labels, value) for every sample of the metric.
+        """
+        raise NotImplementedError("Subclasses should implement this!")
+
+
+class Counter(Metric):
+    """
+    A monotonically increasing count, e.g. of fetches or tokens.
+    """
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    """
+    A distribution of observed values (e.g. durations) over cumulative buckets.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the wall-clock duration of the with block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """
+    The set of metrics exported by /metrics, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry and the metrics recorded across the pipeline
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "analyzer_stage_duration_seconds", "Duration of each analysis stage", ("stage",)
+)
+FETCHES = registry.counter(
+    "analyzer_fetches_total", "Page downloads by outcome", ("outcome",)
+)
+FETCH_BYTES = registry.counter(
+    "analyzer_fetch_bytes_total", "Bytes of page bodies downloaded"
+)
+CACHE_LOOKUPS = registry.counter(
+    "analyzer_cache_lookups_total", "Page and completion cache lookups", ("cache", "result")
+)
+LLM_TOKENS = registry.counter(
+    "analyzer_llm_tokens_total", "Tokens reported by the OpenAI API", ("model", "kind")
+)
+COALESCED_CALLS = registry.counter(
+    "analyzer_coalesced_calls_total", "Calls served by an identical call already in flight", ("kind",)
+)
+RETRIES = registry.counter(
+    "analyzer_retries_total", "Fetches and OpenAI calls retried after a retryable failure", ("kind",)
+)
+DEDUP_SAVED_CHARS = registry.counter(
+    "analyzer_dedup_saved_chars_total", "Characters of repeated content kept out of prompts", ("kind",)
+)
+LLM_TIME_TO_FIRST_TOKEN = registry.histogram(
+    "analyzer_llm_time_to_first_token_seconds", "Time from a streamed completion request to its first token", ("model",)
+)
+
+
+_trace_id = ContextVar("trace_id", default=None)
+
+
+def current_trace_id():
+    """
+    Return the trace ID of the analysis running in this context, or None.
+    """
+    return _trace_id.get()
+
+
+@contextmanager
+def trace(trace_id=None):
+    """
+    Run the with block as one analysis, tagging its spans with a (new) trace ID.
+
+    The ID lives in a context variable, so it follows the analysis into tasks,
+    asyncio.to_thread() calls and coroutines submitted through run_sync().
+    """
+    trace_id = trace_id or uuid.uuid4().hex
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
+
+
+def record_usage(model, usage):
+    """
+    Count the prompt and completion tokens of an OpenAI usage object.
+    """
+    if usage is None:
+        return
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind="prompt")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, kind="completion")
+
+
+@contextmanager
+def span(stage, **fields):
+    """
+    Time one stage of an analysis.
+
+    The duration is added to analyzer_stage_duration_seconds and a structured JSON
+    record (stage, trace ID, duration, outcome and any fields) is logged. The block
+    gets the fields dict, so it can attach results such as page or token counts.
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        yield fields
+    except BaseException as e:
+        error = e.__class__.__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=stage)
+        span_logger.info(
+            "span",
+            extra={
+                "fields": {
+                    "trace_id": current_trace_id(),
+                    "stage": stage,
+                    "duration_ms": round(duration * 1000, 3),
+                    "error": error,
+                    **fields,
+                }
+            },
+        )
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+from logger import configured_logger
+from scheduler import SCHEDULER_ENABLED
+
+load_dotenv()
+OPENAI_CLIENT_POOL_SIZE = int(os.getenv("OPENAI_CLIENT_POOL_SIZE", "32"))
+# The scheduler retries API calls itself; SDK retries on top would multiply them
+OPENAI_MAX_RETRIES = 0 if SCHEDULER_ENABLED else 2
+
+
+class OpenAIClientPool:
+    """
+    A bounded LRU pool of OpenAI clients keyed by API key.
+
+    Every tenant key gets its own client, and with it its own keep-alive HTTP
+    connection pool. A key of None uses the OPENAI_API_KEY environment variable.
+    Async clients are additionally kept per event loop, since their connections
+    are bound to the loop that opened them.
+    """
+
+    def __init__(self, maxsize=OPENAI_CLIENT_POOL_SIZE):
+        self.maxsize = maxsize
+        self._clients = OrderedDict()  # api key -> OpenAI
+        self._async_clients = weakref.WeakKeyDictionary()  # loop -> OrderedDict(api key -> AsyncOpenAI)
+        self._lock = threading.Lock()
+
+    def get(self, api_key=None):
+        """
+        Return the synchronous client for an API key.
+        """
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = OpenAI(api_key=api_key, max_retries=OPENAI_MAX_RETRIES)
+                self._clients[api_key] = client
+            self._clients.move_to_end(api_key)
+            self._evict(self._clients)
+        return client
+
+    def get_async(self, api_key=None):
+        """
+        Return the async client for an API key on the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, OrderedDict())
+            client = clients.get(api_key)
+            if client is None:
+                client = AsyncOpenAI(api_key=api_key, max_retries=OPENAI_MAX_RETRIES)
+                clients[api_key] = client
+            clients.move_to_end(api_key)
+            self._evict(clients)
+        return client
+
+    def ensure_async(self, client=None):
+        """
+        Return an async client for the running loop: the given AsyncOpenAI as is, or
+        the pooled async client for the API key of a synchronous client (or the
+        default key when client is None).
+        """
+        if isinstance(client, AsyncOpenAI):
+            return client
+        return self.get_async(client.api_key if client is not None else None)
+
+    def _evict(self, clients):
+        # Evicted clients are only dropped: the SDK closes their HTTP pool once they
+        # are garbage collected, so requests still holding one can finish first
+        evicted = 0
+        while len(clients) > self.maxsize:
+            clients.popitem(last=False)
+            evicted += 1
+        if evicted:
+            configured_logger.info("Evicted %d least recently used OpenAI clients", evicted)
+
+
+# Shared pool instance
+client_pool = OpenAIClientPool()
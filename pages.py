@@ -0,0 +1,217 @@
+import asyncio
+import threading
+from dataclasses import dataclass, replace
+from urllib.parse import urlsplit
+from disk_cache import get_disk_cache
+from extractors import get_extractor
+from fetcher import FetchError, afetch, fetch
+from logger import configured_logger
+from metrics import CACHE_LOOKUPS, STAGE_SECONDS
+from progress import emit
+from singleflight import SingleFlight
+from urls import canonicalize
+
+
+_default_extractor = get_extractor()
+_page_flight = SingleFlight("page_fetch")
+
+
+@dataclass(frozen=True)
+class Page:
+    """
+    The result of fetching and parsing a single URL: title, cleaned text and links,
+    with the anchor text of each link.
+    """
+
+    url: str
+    title: str = "No title found"
+    text: str = ""
+    links: tuple = ()
+    anchors: tuple = ()  # Anchor text of each link, in the same order
+    final_url: str = None  # Where the URL redirected to, if it did
+
+
+def parse_page(url, body, extractor=None, final_url=None):
+    """
+    Parses a raw HTML body once and extracts the title, visible text, links and anchors,
+    using the configured HTML_EXTRACTOR backend unless one is given.
+
+    Relative links are resolved against final_url, the address the body was actually
+    served from, when the request was redirected. Links that are not valid URLs
+    (e.g. a malformed IPv6 host) are skipped.
+    """
+    extractor = extractor or _default_extractor
+    final_url = final_url if final_url and final_url != url else None
+    with STAGE_SECONDS.time(stage="parse"):
+        title, text, links, anchors = extractor.extract(final_url or url, body)
+
+    # Carefully process links: one bad href must not cost the whole page
+    valid_links = []
+    valid_anchors = []
+    for link, anchor in zip(links, anchors):
+        try:
+            urlsplit(link)
+        except ValueError as link_error:
+            configured_logger.debug("Skipping invalid link %s on %s: %s", link, url, link_error)
+            continue
+        valid_links.append(link)
+        valid_anchors.append(anchor)
+    return Page(
+        url=url,
+        title=title,
+        text=text,
+        links=tuple(valid_links),
+        anchors=tuple(valid_anchors),
+        final_url=final_url,
+    )
+
+
+def _from_disk(url, cached, result="hit"):
+    CACHE_LOOKUPS.inc(cache="page_disk", result=result)
+    return Page(
+        url=url,
+        title=cached.title,
+        text=cached.text,
+        links=cached.links,
+        anchors=cached.anchors,
+        final_url=cached.final_url,
+    )
+
+
+def fetch_page(url):
+    """
+    Downloads a URL through the shared fetch client and parses it into a Page.
+
+    Pages in the disk cache are served without any network traffic while fresh, and
+    revalidated with a conditional GET once stale; a 304 answer skips parsing too.
+    """
+    disk_cache = get_disk_cache()
+    cached = disk_cache.lookup(url) if disk_cache else None
+    if cached and cached.is_fresh():
+        return _from_disk(url, cached)
+
+    response = fetch(url, headers=cached.conditional_headers() if cached else None)
+    if response.status_code == 304 and cached:
+        disk_cache.revalidated(url)
+        return _from_disk(url, cached, result="revalidated")
+
+    if disk_cache:
+        CACHE_LOOKUPS.inc(cache="page_disk", result="miss")
+    page = parse_page(url, response.body, final_url=response.url)
+    if disk_cache:
+        disk_cache.store(url, page, response.body, response.headers)
+    return page
+
+
+async def afetch_page(url):
+    """
+    Async counterpart of fetch_page(); parsing and disk cache access run in worker
+    threads to keep the loop free.
+
+    Concurrent fetches of the same page, e.g. by simultaneous analyses of one
+    company, are coalesced into a single download.
+    """
+    page = await _page_flight.do(canonicalize(url), lambda: _afetch_page(url))
+    return page if page.url == url else replace(page, url=url)
+
+
+async def _afetch_page(url):
+    disk_cache = get_disk_cache()
+    cached = await asyncio.to_thread(disk_cache.lookup, url) if disk_cache else None
+    if cached and cached.is_fresh():
+        return _from_disk(url, cached)
+
+    response = await afetch(url, headers=cached.conditional_headers() if cached else None)
+    if response.status_code == 304 and cached:
+        await asyncio.to_thread(disk_cache.revalidated, url)
+        return _from_disk(url, cached, result="revalidated")
+
+    if disk_cache:
+        CACHE_LOOKUPS.inc(cache="page_disk", result="miss")
+    page = await asyncio.to_thread(parse_page, url, response.body, final_url=response.url)
+    if disk_cache:
+        await asyncio.to_thread(
+            disk_cache.store, url, page, response.body, response.headers
+        )
+    return page
+
+
+class PageCache:
+    """
+    A request-scoped cache of parsed pages, shared by every Website in one analysis.
+
+    Each URL is fetched and parsed at most once, keyed by its canonical form so
+    spellings that only differ by case, fragment or tracking parameters share an
+    entry. Failed fetches are remembered too, so a broken link is not retried by
+    every Website that encounters it.
+    """
+
+    def __init__(self, fetcher=fetch_page, afetcher=afetch_page):
+        self.fetcher = fetcher
+        self.afetcher = afetcher
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Return the parsed page for a URL, fetching it on first use.
+        """
+        with self._lock:
+            entry = self._pages.get(canonicalize(url))
+        CACHE_LOOKUPS.inc(cache="page_memory", result="miss" if entry is None else "hit")
+        if entry is None:
+            try:
+                entry = self.fetcher(url)
+            except FetchError as e:
+                entry = e
+            entry = self._store(url, entry)
+            self._fetched(url, entry)
+        return self._unwrap(entry)
+
+    async def aget(self, url):
+        """
+        Async counterpart of get(), fetching through the async client.
+        """
+        with self._lock:
+            entry = self._pages.get(canonicalize(url))
+        CACHE_LOOKUPS.inc(cache="page_memory", result="miss" if entry is None else "hit")
+        if entry is None:
+            try:
+                entry = await self.afetcher(url)
+            except FetchError as e:
+                entry = e
+            entry = self._store(url, entry)
+            self._fetched(url, entry)
+        return self._unwrap(entry)
+
+    def _store(self, url, entry):
+        with self._lock:
+            return self._pages.setdefault(canonicalize(url), entry)
+
+    @staticmethod
+    def _fetched(url, entry):
+        if isinstance(entry, Exception):
+            emit("page", url=url, error=str(entry))
+        else:
+            emit("page", url=url, title=entry.title, chars=len(entry.text), links=len(entry.links))
+
+    @staticmethod
+    def _unwrap(entry):
+        if isinstance(entry, Exception):
+            raise entry
+        return entry
+
+    def put(self, url, page):
+        """
+        Store a page fetched elsewhere (e.g. by the async crawler).
+        """
+        with self._lock:
+            self._pages.setdefault(canonicalize(url), page)
+
+    def __contains__(self, url):
+        with self._lock:
+            return canonicalize(url) in self._pages
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pages)
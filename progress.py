@@ -0,0 +1,29 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_listener = ContextVar("progress_listener", default=None)
+
+
+@contextmanager
+def listen(callback):
+    """
+    Send the progress events of the analysis run in the with block to
+    callback(event, data).
+
+    Like trace IDs, the listener lives in a context variable, so it follows the
+    analysis into tasks and worker threads; the callback must be thread-safe.
+    """
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def emit(event, **data):
+    """
+    Report a progress event (e.g. "page" or "links") to the current listener, if any.
+    """
+    listener = _listener.get()
+    if listener is not None:
+        listener(event, data)
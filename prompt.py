@@ -32,3 +32,16 @@ Include details of company culture, customers and careers/jobs if you have the i
 
 user_prompt_for_summary = """You are looking at a company called: {company_name}\n"""
 user_prompt_for_summary += """Here are the contents of its landing page and other relevant pages; use this information to build a summary of the company in markdown.\n"""
+
+# Map-reduce summarization: each page (or chunk of a long page) is summarized on its
+# own, then the partial summaries are combined with system_prompt_for_summary
+
+system_prompt_for_page_summary = "You are an assistant that extracts what matters about a company from one page of its website. \
+Summarize the page in concise markdown bullet points, keeping concrete facts about the company's products, customers, \
+culture, leadership, funding and careers/jobs. Start with the page's type or title. Leave out navigation, legal text and anything unrelated."
+
+user_prompt_for_page_summary = """This page belongs to the website of a company called: {company_name}\n"""
+user_prompt_for_page_summary += """Here are its contents:\n"""
+
+user_prompt_for_combined_summary = """You are looking at a company called: {company_name}\n"""
+user_prompt_for_combined_summary += """Here are summaries of its landing page and other relevant pages; use this information to build a summary of the company in markdown.\n"""
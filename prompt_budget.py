@@ -0,0 +1,171 @@
+import json
+import os
+from dotenv import load_dotenv
+from logger import configured_logger
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to a characters-per-token estimate
+    tiktoken = None
+
+load_dotenv()
+# Roughly the old 20,000 character cap
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "5000"))
+# Per-model overrides, e.g. PROMPT_TOKEN_BUDGETS='{"gpt-4o": 20000}'
+MODEL_PROMPT_TOKEN_BUDGETS = json.loads(os.getenv("PROMPT_TOKEN_BUDGETS", "{}"))
+CHARS_PER_TOKEN = 4
+
+_encodings = {}
+
+
+def prompt_token_budget(model):
+    """
+    Return the summary prompt token budget configured for a model.
+    """
+    return int(MODEL_PROMPT_TOKEN_BUDGETS.get(model, PROMPT_TOKEN_BUDGET))
+
+
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return _encodings[model]
+
+
+def count_tokens(text, model=None):
+    """
+    Count the tokens of a text for a model (estimated when tiktoken is not installed).
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model=None):
+    """
+    Cut a text down to max_tokens, preferring to end on a line boundary.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is None:
+        limit = max_tokens * CHARS_PER_TOKEN
+        if len(text) <= limit:
+            return text
+        truncated = text[:limit]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        truncated = encoding.decode(tokens[:max_tokens])
+
+    # Don't cut a line in half unless that would throw most of the share away
+    line_end = truncated.rfind("\n")
+    if line_end > len(truncated) // 2:
+        truncated = truncated[:line_end]
+    return truncated
+
+
+def split_to_tokens(text, max_tokens, model=None):
+    """
+    Split a text into pieces of at most max_tokens, preferring to cut on line boundaries.
+    """
+    max_tokens = max(1, max_tokens)
+    pieces = []
+    while text.strip():
+        piece = truncate_to_tokens(text, max_tokens, model)
+        pieces.append(piece)
+        text = text[len(piece):]
+    return pieces
+
+
+class PromptAssembler:
+    """
+    Builds a prompt from page sections within a token budget.
+
+    Sections are pulled lazily, in priority order, as (section, sections_left) pairs.
+    Each section gets a fair share of what is left of the budget (budget left divided
+    by the sections still to come), and whatever a short section doesn't use rolls
+    over to the next ones. Once the budget is spent no more sections are pulled, so
+    pages that would have been thrown away are never fetched.
+    """
+
+    def __init__(self, budget_tokens, model=None, min_section_tokens=64):
+        self.budget_tokens = budget_tokens
+        self.model = model
+        self.min_section_tokens = min_section_tokens
+        self.used_tokens = 0
+        self.sections_used = 0
+        self.sections_truncated = 0
+
+    def assemble(self, header, sections, separator="\n"):
+        """
+        Return header followed by as much of the sections as the budget allows.
+        """
+        self._start(header)
+        parts = []
+        try:
+            while self._has_room():
+                try:
+                    section, sections_left = next(sections)
+                except StopIteration:
+                    break
+                parts.append(self._fit(section, sections_left, separator))
+        finally:
+            # Stops any page fetches the section generator still has lined up
+            if hasattr(sections, "close"):
+                sections.close()
+        return self._finish(header, parts, separator)
+
+    async def aassemble(self, header, sections, separator="\n"):
+        """
+        Async counterpart of assemble() for an async generator of sections.
+        """
+        self._start(header)
+        parts = []
+        try:
+            while self._has_room():
+                try:
+                    section, sections_left = await anext(sections)
+                except StopAsyncIteration:
+                    break
+                parts.append(self._fit(section, sections_left, separator))
+        finally:
+            # Stops any page fetches the section generator still has lined up
+            if hasattr(sections, "aclose"):
+                await sections.aclose()
+        return self._finish(header, parts, separator)
+
+    def _start(self, header):
+        self.used_tokens = count_tokens(header, self.model)
+        self.sections_used = 0
+        self.sections_truncated = 0
+
+    def _has_room(self):
+        return self.budget_tokens - self.used_tokens >= self.min_section_tokens
+
+    def _fit(self, section, sections_left, separator):
+        remaining = self.budget_tokens - self.used_tokens
+        share = remaining // (sections_left + 1)
+        trimmed = truncate_to_tokens(section, share, self.model)
+        if len(trimmed) < len(section):
+            self.sections_truncated += 1
+
+        self.sections_used += 1
+        self.used_tokens += count_tokens(separator + trimmed, self.model)
+        return trimmed
+
+    def _finish(self, header, parts, separator):
+        configured_logger.info(
+            "Assembled prompt: %d/%d tokens, %d sections (%d truncated)",
+            self.used_tokens,
+            self.budget_tokens,
+            self.sections_used,
+            self.sections_truncated,
+        )
+        return header + separator.join(parts)
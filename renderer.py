@@ -0,0 +1,118 @@
+import os
+import re
+from dotenv import load_dotenv
+from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.text import Text
+
+load_dotenv()
+RENDER_FPS = float(os.getenv("RENDER_FPS", "8"))
+
+FENCE = "```markdown"
+FENCE_PATTERN = re.compile(r"```(?:markdown)?")
+
+
+class FenceStripper:
+    """
+    Incrementally removes ``` fences (and a "markdown" tag right after one) from a
+    stream of chunks, even when a fence is split across chunks.
+    """
+
+    def __init__(self):
+        self._carry = ""
+
+    def feed(self, chunk):
+        """
+        Return the cleaned text that is safe to emit for this chunk.
+        """
+        text = self._carry + chunk
+        # Hold back a tail that could still grow into a fence with the next chunk
+        hold = 0
+        for size in range(min(len(text), len(FENCE)), 0, -1):
+            if FENCE.startswith(text[-size:]):
+                hold = size
+                break
+        if hold:
+            text, self._carry = text[:-hold], text[-hold:]
+        else:
+            self._carry = ""
+        return FENCE_PATTERN.sub("", text)
+
+    def flush(self):
+        """
+        Return whatever was held back once the stream has ended.
+        """
+        text, self._carry = self._carry, ""
+        return FENCE_PATTERN.sub("", text)
+
+
+class _BufferView:
+    """
+    A Rich renderable over the chunk buffer; the chunks are only joined when a
+    frame is actually drawn, not on every chunk.
+
+    Only the last lines that fit on the screen are drawn: Live cannot erase lines
+    that scrolled off, so a taller view would be repeated in the scrollback.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __rich_console__(self, console, options):
+        lines = Text("".join(self.parts)).wrap(console, options.max_width)
+        height = max(1, (options.height or console.height) - 1)
+        yield Text("\n").join(lines[-height:])
+
+
+class LiveMarkdownRenderer:
+    """
+    Renders a streamed response in the terminal.
+
+    Chunks are appended to a buffer in O(1), and a Rich Live view redraws the tail of
+    the plain text that fits on the screen at most refresh_per_second times. The
+    final Markdown is rendered once, in full, when the stream ends.
+    """
+
+    def __init__(self, console=None, refresh_per_second=RENDER_FPS):
+        self.console = console or Console()
+        self.refresh_per_second = refresh_per_second
+        self._parts = []
+        self._stripper = FenceStripper()
+        self._live = None
+
+    def __enter__(self):
+        self._live = Live(
+            _BufferView(self._parts),
+            console=self.console,
+            refresh_per_second=self.refresh_per_second,
+            vertical_overflow="crop",
+            transient=True,
+        )
+        self._live.__enter__()
+        return self
+
+    def feed(self, chunk):
+        """
+        Add a streamed chunk to the buffer.
+        """
+        cleaned = self._stripper.feed(chunk)
+        if cleaned:
+            self._parts.append(cleaned)
+
+    @property
+    def text(self):
+        """
+        The cleaned response received so far.
+        """
+        return "".join(self._parts)
+
+    def __exit__(self, exc_type, exc, traceback):
+        tail = self._stripper.flush()
+        if tail:
+            self._parts.append(tail)
+        self._live.__exit__(exc_type, exc, traceback)
+        self._live = None
+        if exc_type is None:
+            self.console.print(Markdown(self.text))
+        return False
@@ -0,0 +1,38 @@
+def _directives(text):
+    for line in text.splitlines():
+        name, _, value = line.split("#", 1)[0].partition(":")
+        yield name.strip().lower(), value.strip()
+
+
+def robots_sitemaps(text):
+    """
+    Return the Sitemap URLs declared in a robots.txt file, in order.
+    """
+    return [value for name, value in _directives(text) if name == "sitemap" and value]
+
+
+def robots_crawl_delay(text, user_agent="*"):
+    """
+    Return the Crawl-delay in seconds that a robots.txt file asks of user_agent (or
+    of every crawler, "*"), or None.
+    """
+    agents = []
+    in_rules = False
+    delays = {}  # agent -> delay
+    for name, value in _directives(text):
+        if name == "user-agent":
+            if in_rules:
+                # A User-agent line after rules starts a new group
+                agents = []
+                in_rules = False
+            agents.append(value.lower())
+        elif name:
+            in_rules = True
+            if name == "crawl-delay":
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                for agent in agents:
+                    delays.setdefault(agent, delay)
+    return delays.get(user_agent.lower(), delays.get("*"))
@@ -1,15 +1,27 @@
-from fastapi import APIRouter, Form
+from fastapi import APIRouter, Form, Query
 from fastapi.responses import JSONResponse, StreamingResponse
-from pydantic import BaseModel, HttpUrl
+from typing import List, Optional
+from pydantic import BaseModel, Field, HttpUrl
+from batch import BATCH_CONCURRENCY, BATCH_PER_DOMAIN_CONCURRENCY, analyze_batch
+from completion_cache import acached_stream, replay_chunks
+from jobs import FAILED, job_queue
 from logger import configured_logger
-from main import SummaryGenerator, SummaryOutputStrategy, openai, MODEL, get_summary_user_prompt
+from main import SummaryGenerator, SummaryOutputStrategy, MODEL, aprepare_summary
+from metrics import current_trace_id, span, trace
+from openai_clients import client_pool
+from progress import emit, listen
 from dotenv import load_dotenv
+import asyncio
+import json
 import os
-from prompt import system_prompt_for_summary
+import time
+import uuid
 
 load_dotenv()
 
 app_name = os.getenv("APP_NAME")
+# Idle time after which an SSE comment is sent so proxies keep the connection open
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
 router = APIRouter(
     prefix="/api",
     tags=[app_name],
@@ -24,7 +36,26 @@ class Request(BaseModel):
     gpt_model: str
 
 
+class BatchItem(BaseModel):
+    company_name: str
+    url: HttpUrl
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    openai_secret_key: str
+    gpt_model: str
+    concurrency: Optional[int] = Field(None, ge=1)  # Defaults to BATCH_CONCURRENCY
+    per_domain_concurrency: Optional[int] = Field(None, ge=1)  # Defaults to BATCH_PER_DOMAIN_CONCURRENCY
+
+
 class APIStreamingOutputStrategy(SummaryOutputStrategy):
+    def __init__(self, client=None, model=None, prepared=None):
+        super().__init__(client=client, model=model)
+        # The PreparedSummary the messages came from: a stored summary is replayed
+        # instead of streamed, and a streamed one is stored once it completes
+        self.prepared = prepared
+
     async def handle_output(self, messages):
         """
         Streams output directly to the FastAPI client as it is being generated.
@@ -36,26 +67,46 @@ class APIStreamingOutputStrategy(SummaryOutputStrategy):
             StreamingResponse: A FastAPI StreamingResponse object.
         """
         try:
-            # Initialize the OpenAI API stream using the environment variables set earlier
-            response = openai.chat.completions.create(
-                model=MODEL,  # This will be set dynamically based on the request
-                messages=messages,
-                stream=True,
-            )
+            prepared = self.prepared
+            if prepared is not None and prepared.summary is not None:
+                response = _areplay(prepared.summary)
+            else:
+                # Initialize the async OpenAI API stream with the tenant's client and model;
+                # a cached completion is replayed as a stream instead
+                response = await acached_stream(
+                    client_pool.ensure_async(self.client),
+                    self.model,  # This is set dynamically based on the request
+                    messages,
+                )
+
+            # The body is streamed after the endpoint returns, so carry the trace along
+            trace_id = current_trace_id()
 
             async def stream_generator():
-                for chunk in response:
-                    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content is not None:
-                        content = chunk.choices[0].delta.content
+                with trace(trace_id), span("summary_stream", model=self.model):
+                    parts = []
+                    async for content in response:
+                        parts.append(content)
                         yield content
+                    if prepared is not None:
+                        await prepared.save("".join(parts))
 
             # Return the stream generator as a FastAPI StreamingResponse
-            return StreamingResponse(stream_generator(), media_type="text/plain")
+            return StreamingResponse(
+                stream_generator(),
+                media_type="text/plain",
+                headers={"X-Trace-Id": trace_id} if trace_id else None,
+            )
 
         except Exception as e:
-            configured_logger.error(f"Error in APIStreamingOutputStrategy --> {str(e)}", exc_info=True)
+            configured_logger.error("Error in APIStreamingOutputStrategy --> %s", e, exc_info=True)
             raise RuntimeError(f"Error in APIStreamingOutputStrategy --> {str(e)}")
 
+async def _areplay(summary):
+    for chunk in replay_chunks(summary):
+        yield chunk
+
+
 @router.post("/analyze/")
 async def generate_summary(
     request: Request, # Accept GPT model name from the request
@@ -67,32 +118,218 @@ async def generate_summary(
     Returns:
         StreamingResponse: Streamed summary result.
     """
+    # Every stage of this analysis is logged under one trace ID
+    with trace():
+        return await _generate_summary(request)
+
+
+async def _generate_summary(request):
     try:
-        # Set the OpenAI secret key and GPT model dynamically based on the request
-        if request.openai_secret_key:
-            os.environ["OPENAI_API_KEY"] = request.openai_secret_key
-        if request.gpt_model:
-            os.environ["MODEL"] = request.gpt_model
+        # Use the OpenAI secret key and GPT model of this request; clients are pooled per key
+        client = client_pool.get_async(request.openai_secret_key or None)
+        model = request.gpt_model or MODEL
 
-        website_url = request.url
+        website_url = str(request.url)
         configured_logger.info("Received Website URL: %s", website_url)
 
-        # Create the appropriate output strategy for streaming
-        strategy = APIStreamingOutputStrategy()
+        # Prepare the messages for the OpenAI API, or reuse the last summary if the
+        # site did not change (incremental analysis)
+        prepared = await aprepare_summary(
+            request.company_name, website_url, client=client, model=model
+        )
 
-        # Prepare the messages for the OpenAI API
-        messages = [
-            {"role": "system", "content": system_prompt_for_summary},
-            {"role": "user", "content": get_summary_user_prompt(request.company_name, website_url)},
-        ]
+        # Create the appropriate output strategy for streaming
+        strategy = APIStreamingOutputStrategy(client=client, model=model, prepared=prepared)
 
         # Use the strategy to generate the streamed response
-        return await strategy.handle_output(messages)
+        return await strategy.handle_output(prepared.messages)
 
     except Exception as e:
         # Handle errors gracefully
-        configured_logger.error(f"Error generating summary --> {str(e)}")
+        configured_logger.error("Error generating summary --> %s", e)
         return JSONResponse(
             content={"error": f"Failed to generate summary: {str(e)}"},
             status_code=500,
         )
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _analyze_with_events(request):
+    # Progress events of the stages below reach the listener set by the caller
+    client = client_pool.get_async(request.openai_secret_key or None)
+    model = request.gpt_model or MODEL
+    prepared = await aprepare_summary(
+        request.company_name, str(request.url), client=client, model=model
+    )
+    if prepared.summary is not None:
+        stream = _areplay(prepared.summary)
+        prompt_chars = 0
+    else:
+        stream = await acached_stream(client, model, prepared.messages)
+        prompt_chars = len(prepared.messages[-1]["content"])
+    parts = []
+    with span("summary_stream", model=model):
+        async for content in stream:
+            parts.append(content)
+            emit("token", text=content)
+    await prepared.save("".join(parts))
+    return prompt_chars, sum(len(part) for part in parts)
+
+
+@router.post("/analyze/events")
+async def generate_summary_events(request: Request):
+    """
+    Generate a summary like /analyze/, streaming progress as Server-Sent Events.
+    Args:
+        request (Request): The same JSON body as /analyze/.
+    Returns:
+        StreamingResponse: A text/event-stream with, in order, a "start" event,
+            "page" events as pages are fetched, a "links" event with the selected
+            links, with incremental analysis an "unchanged" or "changed" event,
+            a "prompt" event with the prompt size, "token" events with the
+            summary text, and a final "stats" (or "error") event.
+    """
+    trace_id = uuid.uuid4().hex
+
+    async def event_generator():
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def listener(event, data):
+            # Stages may report from worker threads
+            loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+        yield format_sse("start", {"trace_id": trace_id, "url": str(request.url)})
+
+        with trace(trace_id), listen(listener):
+            task = asyncio.create_task(_analyze_with_events(request))
+        task.add_done_callback(lambda _: loop.call_soon_threadsafe(events.put_nowait, None))
+
+        pages = 0
+        first_token = None
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(events.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    break
+                event, data = item
+                if event == "page":
+                    pages += 1
+                elif event == "token" and first_token is None:
+                    first_token = time.perf_counter()
+                yield format_sse(event, data)
+
+            try:
+                prompt_chars, summary_chars = task.result()
+            except Exception as e:
+                configured_logger.error("Error generating summary events --> %s", e)
+                yield format_sse("error", {"error": f"Failed to generate summary: {str(e)}"})
+                return
+            yield format_sse(
+                "stats",
+                {
+                    "trace_id": trace_id,
+                    "pages_fetched": pages,
+                    "prompt_chars": prompt_chars,
+                    "summary_chars": summary_chars,
+                    "time_to_first_token_ms": (
+                        round((first_token - started) * 1000, 1) if first_token else None
+                    ),
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                },
+            )
+        finally:
+            # A client that disconnects stops the analysis
+            task.cancel()
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Trace-Id": trace_id},
+    )
+
+
+@router.post("/analyze/batch")
+async def generate_batch_summaries(request: BatchRequest):
+    """
+    Generate summaries for many companies and stream them back as NDJSON.
+    Args:
+        request (BatchRequest): JSON object with the items to analyze and the shared
+            OpenAI secret key, GPT model and optional concurrency limits.
+    Returns:
+        StreamingResponse: One JSON line per item, in completion order, with either a
+            "summary" or an "error" key.
+    """
+    client = client_pool.get_async(request.openai_secret_key or None)
+    model = request.gpt_model or MODEL
+    items = [(item.company_name, str(item.url)) for item in request.items]
+
+    async def ndjson_generator():
+        async for result in analyze_batch(
+            items,
+            client,
+            model,
+            concurrency=request.concurrency or BATCH_CONCURRENCY,
+            per_domain_concurrency=request.per_domain_concurrency or BATCH_PER_DOMAIN_CONCURRENCY,
+        ):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
+
+
+@router.post("/jobs/", status_code=202)
+async def submit_job(request: Request):
+    """
+    Queue an analysis and return its job ID right away.
+    Args:
+        request (Request): The same JSON body as /analyze/.
+    Returns:
+        dict: The job ID and its initial status.
+    """
+    job_id = await job_queue.submit(
+        request.company_name,
+        str(request.url),
+        api_key=request.openai_secret_key or None,
+        model=request.gpt_model or MODEL,
+    )
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Poll a job: its status, the length of the output so far, and the result once completed.
+    """
+    status = await job_queue.status(job_id)
+    if status is None:
+        return JSONResponse(content={"error": f"Unknown job {job_id}"}, status_code=404)
+    return status
+
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, offset: int = Query(0, ge=0)):
+    """
+    Stream a job's output from a character offset, following it until it finishes.
+    A client that lost its connection resumes by passing the length it already has.
+
+    A job that already failed answers with its error instead. If the job fails while
+    it is being followed, the response is aborted rather than ended, so a truncated
+    body never looks complete; GET /jobs/{job_id} then reports the failure.
+    """
+    status = await job_queue.status(job_id)
+    if status is None:
+        return JSONResponse(content={"error": f"Unknown job {job_id}"}, status_code=404)
+    if status["status"] == FAILED:
+        return JSONResponse(
+            content={"error": f"Job {job_id} failed: {status['error']}", "length": status["length"]},
+            status_code=500,
+        )
+    return StreamingResponse(job_queue.stream(job_id, offset), media_type="text/plain")
@@ -0,0 +1,287 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dotenv import load_dotenv
+from logger import configured_logger
+from metrics import RETRIES
+
+load_dotenv()
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEDULER_RETRIES = int(os.getenv("SCHEDULER_RETRIES", "3"))
+SCHEDULER_BACKOFF_SECONDS = float(os.getenv("SCHEDULER_BACKOFF_SECONDS", "0.5"))
+SCHEDULER_MAX_BACKOFF_SECONDS = float(os.getenv("SCHEDULER_MAX_BACKOFF_SECONDS", "30"))
+# Longer Retry-After (or Crawl-delay) values are capped rather than waited out in full
+SCHEDULER_MAX_WAIT_SECONDS = float(os.getenv("SCHEDULER_MAX_WAIT_SECONDS", "30"))
+# Hosts and API keys tracked at once; the least recently used are forgotten
+SCHEDULER_MAX_KEYS = int(os.getenv("SCHEDULER_MAX_KEYS", "1024"))
+# Requests in flight count as overloaded once their latency exceeds this multiple of the best recent one
+SCHEDULER_LATENCY_TOLERANCE = float(os.getenv("SCHEDULER_LATENCY_TOLERANCE", "3"))
+
+
+def parse_retry_after(headers):
+    """
+    Return the delay in seconds asked for by Retry-After (or retry-after-ms) headers, or None.
+    """
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        date = email.utils.parsedate_tz(retry_after)
+        return max(0.0, email.utils.mktime_tz(date) - time.time()) if date else None
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled at `rate` tokens per second up to `burst`.
+
+    Callers reserve a token and are told how long to wait for it, so one bucket
+    paces synchronous threads and any number of event loops alike. A rate of 0
+    means unlimited. pause() holds every caller back, e.g. for a Retry-After.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token and return the delay in seconds before it may be used.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._paused_until - now)
+            if self.rate <= 0:
+                return delay
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens < 0:
+                delay = max(delay, -self._tokens / self.rate)
+            return delay
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def slow_down(self, rate):
+        """
+        Lower the rate (e.g. to a robots.txt Crawl-delay), never raising it.
+        """
+        with self._lock:
+            if rate > 0 and (self.rate <= 0 or rate < self.rate):
+                self.rate = rate
+                self.burst = 1.0
+                self._tokens = min(self._tokens, self.burst)
+
+
+class AdaptiveLimiter:
+    """
+    An AIMD concurrency limit for one event loop.
+
+    Each success with a healthy latency raises the limit by about one per limit's
+    worth of requests; an overloaded answer (429, 5xx, timeout) halves it and a
+    latency beyond latency_tolerance times the best recent one trims it. With a
+    latency_tolerance of None only overloaded answers lower the limit.
+    """
+
+    def __init__(self, initial, minimum, maximum, latency_tolerance=SCHEDULER_LATENCY_TOLERANCE):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self._baseline = None  # Best recent latency, drifting up slowly
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency=None, overloaded=False):
+        async with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif latency is not None:
+                self._baseline = latency if self._baseline is None else min(self._baseline * 1.05, latency)
+                if self.latency_tolerance is not None and latency > self._baseline * self.latency_tolerance:
+                    self.limit = max(self.minimum, self.limit * 0.9)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class Scheduler:
+    """
+    Paces, bounds and retries calls to a shared resource, per key (a host or an API key).
+
+    Every call waits for a token from the key's TokenBucket and, on async paths, a
+    slot of the key's AdaptiveLimiter. Failures that `classify` reports as retryable
+    are retried up to SCHEDULER_RETRIES times after the Retry-After delay, or a
+    jittered exponential backoff. A Retry-After also pauses every other call for the
+    key, so one 429 does not turn into many.
+    """
+
+    def __init__(
+        self,
+        name,
+        classify,
+        rate=0,
+        burst=1,
+        concurrency=4,
+        max_concurrency=16,
+        latency_tolerance=SCHEDULER_LATENCY_TOLERANCE,
+        prepare=None,
+        aprepare=None,
+    ):
+        self.name = name
+        self.classify = classify  # error -> (retryable, retry_after or None)
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        # None when latency says nothing about load, e.g. when it depends on the response length
+        self.latency_tolerance = latency_tolerance
+        # Optional function, and its coroutine counterpart for arun(), called as
+        # prepare(key, bucket) once per key before its first call, e.g. to read
+        # robots.txt; a prepare that fails is tried again on the next call
+        self.prepare = prepare
+        self.aprepare = aprepare
+        self._buckets = OrderedDict()  # key -> TokenBucket
+        self._prepared = OrderedDict()  # (loop, key) -> task running aprepare(key, bucket)
+        self._sync_prepared = OrderedDict()  # key -> [lock, done]
+        self._limiters = weakref.WeakKeyDictionary()  # loop -> OrderedDict(key -> AdaptiveLimiter)
+        self._lock = threading.Lock()
+
+    def _lookup(self, entries, key, create):
+        with self._lock:
+            entry = entries.get(key)
+            if entry is None:
+                entry = entries[key] = create()
+                while len(entries) > SCHEDULER_MAX_KEYS:
+                    entries.popitem(last=False)
+            entries.move_to_end(key)
+            return entry
+
+    def bucket(self, key):
+        return self._lookup(self._buckets, key, lambda: TokenBucket(self.rate, self.burst))
+
+    def _limiter(self, key):
+        limiters = self._limiters.setdefault(asyncio.get_running_loop(), OrderedDict())
+        return self._lookup(
+            limiters, key, lambda: AdaptiveLimiter(self.concurrency, 1, self.max_concurrency, self.latency_tolerance)
+        )
+
+    def _start_prepare(self, entry, key, bucket):
+        task = asyncio.ensure_future(self.aprepare(key, bucket))
+        task.add_done_callback(lambda done: self._prepare_done(entry, done))
+        return task
+
+    def _prepare_done(self, entry, task):
+        if task.cancelled() or task.exception() is not None:
+            # Forget the failed task, so the next call prepares the key again
+            with self._lock:
+                if self._prepared.get(entry) is task:
+                    del self._prepared[entry]
+
+    def _prepare_sync(self, key, bucket):
+        state = self._lookup(self._sync_prepared, key, lambda: [threading.Lock(), False])
+        with state[0]:
+            if not state[1]:
+                self.prepare(key, bucket)
+                state[1] = True
+
+    def _backoff(self, attempt, retry_after):
+        if retry_after is not None:
+            return min(retry_after, SCHEDULER_MAX_WAIT_SECONDS)
+        # Full jitter keeps retries from many callers from arriving in lockstep
+        return random.uniform(0, min(SCHEDULER_MAX_BACKOFF_SECONDS, SCHEDULER_BACKOFF_SECONDS * 2**attempt))
+
+    def _failed(self, key, bucket, attempt, error):
+        retryable, retry_after = self.classify(error)
+        if not retryable or attempt >= SCHEDULER_RETRIES:
+            return None
+        delay = self._backoff(attempt, retry_after)
+        if retry_after is not None:
+            bucket.pause(delay)
+        RETRIES.inc(kind=self.name)
+        configured_logger.warning(
+            "Retrying %s call for %s in %.2fs (attempt %d): %s", self.name, key, delay, attempt + 1, error
+        )
+        return delay
+
+    async def arun(self, key, call):
+        """
+        Return `await call()`, paced, bounded and retried for the key.
+        """
+        if not SCHEDULER_ENABLED:
+            return await call()
+        bucket = self.bucket(key)
+        if self.aprepare is not None:
+            # Tasks can only be awaited on their own loop
+            entry = (asyncio.get_running_loop(), key)
+            prepared = self._lookup(self._prepared, entry, lambda: self._start_prepare(entry, key, bucket))
+            await asyncio.shield(prepared)
+        limiter = self._limiter(key)
+
+        attempt = 0
+        while True:
+            await asyncio.sleep(bucket.reserve())
+            await limiter.acquire()
+            started = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                delay = self._failed(key, bucket, attempt, e)
+                await limiter.release(overloaded=self.classify(e)[0])
+                if delay is None:
+                    raise
+            except BaseException:
+                await asyncio.shield(limiter.release())
+                raise
+            else:
+                await limiter.release(latency=time.monotonic() - started)
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def run(self, key, call):
+        """
+        Synchronous counterpart of arun(), with pacing and retries but no adaptive limit.
+        """
+        if not SCHEDULER_ENABLED:
+            return call()
+        bucket = self.bucket(key)
+        if self.prepare is not None:
+            self._prepare_sync(key, bucket)
+        attempt = 0
+        while True:
+            time.sleep(bucket.reserve())
+            try:
+                return call()
+            except Exception as e:
+                delay = self._failed(key, bucket, attempt, e)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
@@ -2,8 +2,11 @@ from contextlib import asynccontextmanager
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fetcher import aclose_async_client, close_clients
+from jobs import job_queue
 from logger import configured_logger
+from metrics import registry
 import os
 import modal
 
@@ -23,10 +26,16 @@ app_modal = modal.App(name=app_name, image=image, mounts=[modal.Mount.from_local
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     configured_logger.info(f"Starting {app_name} Service...")
+    # Background workers for /api/jobs/
+    await job_queue.start()
     try:
         yield
     finally:
         configured_logger.info(f"Shutting down {app_name} Service...")
+        await job_queue.stop()
+        # Release pooled keep-alive connections of the shared fetch clients
+        await aclose_async_client()
+        close_clients()
 
 # Create the FastAPI app
 app = FastAPI(
@@ -52,6 +61,11 @@ async def global_exception_handler(request: Request, exc: Exception):
 async def root():
     return {"detail": f"Welcome to the Root of the {app_name} Service!"}
 
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Define the Modal function to serve the FastAPI app
 @app_modal.function()
 @modal.asgi_app()
@@ -0,0 +1,173 @@
+import asyncio
+import weakref
+from metrics import COALESCED_CALLS
+
+
+class Broadcast:
+    """
+    An append-only sequence of chunks that any number of readers can follow.
+
+    Readers get every chunk from their starting offset on, including the ones
+    appended before they attached, and wait for new chunks until the producer
+    finishes. A failed producer's error is raised in every reader.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        # Wake the current readers and give later waits a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, chunk):
+        self.parts.append(chunk)
+        self.length += len(chunk)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def follow(self, offset=0):
+        """
+        Yield the output from character `offset` on, then every new chunk until the
+        producer finishes.
+        """
+        position = 0
+        index = 0
+        while True:
+            while index < len(self.parts):
+                part = self.parts[index]
+                index += 1
+                end = position + len(part)
+                if end > offset:
+                    yield part[max(0, offset - position):]
+                position = end
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Stream(Broadcast):
+    def __init__(self):
+        super().__init__()
+        self.task = None
+        self.opened = asyncio.Event()
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical async work: the first caller for a key starts it,
+    and every caller arriving while it is in flight shares the result (or error).
+
+    The work runs in its own task, so one caller being cancelled does not cancel it
+    for the others; it is only cancelled once every caller has gone. Keys are tracked
+    per event loop, since tasks cannot be awaited across loops.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._calls = weakref.WeakKeyDictionary()  # loop -> {key: _Call or _Stream}
+
+    def _inflight(self):
+        return self._calls.setdefault(asyncio.get_running_loop(), {})
+
+    def _release(self, calls, key, call):
+        if calls.get(key) is call:
+            del calls[key]
+
+    async def do(self, key, function):
+        """
+        Return `await function()`, sharing one call among concurrent callers with the same key.
+        """
+        calls = self._inflight()
+        call = calls.get(key)
+        if call is None:
+            call = calls[key] = _Call(asyncio.ensure_future(function()))
+            call.task.add_done_callback(lambda task: self._finished(calls, key, call))
+        else:
+            COALESCED_CALLS.inc(kind=self.kind)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _finished(self, calls, key, call):
+        self._release(calls, key, call)
+        # Mark a failure as retrieved even when every caller was cancelled
+        if not call.task.cancelled():
+            call.task.exception()
+
+    async def stream(self, key, open_stream):
+        """
+        Multicast an async iterator among concurrent callers with the same key.
+
+        The first caller opens it with `await open_stream()` and a background task
+        pumps its chunks into a Broadcast; every caller, including ones that arrive
+        mid-stream, gets an iterator over the whole output. Errors opening the stream
+        are raised here, as they would be without coalescing.
+        """
+        calls = self._inflight()
+        stream = calls.get(key)
+        if stream is None:
+            stream = calls[key] = _Stream()
+            stream.task = asyncio.ensure_future(self._pump(calls, key, stream, open_stream))
+        else:
+            COALESCED_CALLS.inc(kind=self.kind)
+
+        await stream.opened.wait()
+        if stream.done and stream.error is not None and not stream.parts:
+            raise stream.error
+        stream.followers += 1
+        return self._follow(stream)
+
+    async def _pump(self, calls, key, stream, open_stream):
+        iterator = None
+        try:
+            iterator = await open_stream()
+            stream.opened.set()
+            async for chunk in iterator:
+                stream.append(chunk)
+            stream.finish()
+        except asyncio.CancelledError:
+            stream.finish(RuntimeError("The stream was abandoned by every client"))
+            raise
+        except Exception as e:
+            stream.finish(e)
+        finally:
+            stream.opened.set()
+            self._release(calls, key, stream)
+            if iterator is not None and hasattr(iterator, "aclose"):
+                # Close the upstream response now rather than when it is collected
+                await iterator.aclose()
+
+    async def _follow(self, stream):
+        try:
+            async for chunk in stream.follow():
+                yield chunk
+        finally:
+            stream.followers -= 1
+            # Stop paying for a stream nobody is reading any more
+            if not stream.followers and not stream.done:
+                stream.task.cancel()
@@ -0,0 +1,178 @@
+import heapq
+import logging
+import os
+import time
+import zlib
+from collections import OrderedDict, deque
+from urllib.parse import urljoin, urlsplit
+from xml.etree.ElementTree import ParseError, XMLPullParser
+import httpx
+from dotenv import load_dotenv
+from fetcher import afetch_robots, get_async_client
+from logger import configured_logger
+from metrics import span
+from robots import robots_sitemaps
+from singleflight import SingleFlight
+from urls import VisitedIndex, canonicalize
+
+load_dotenv()
+# "crawl" finds candidate links in the landing page HTML; "sitemap" reads robots.txt
+# and the sitemaps first, and falls back to crawling when a site has none
+LINK_DISCOVERY = os.getenv("LINK_DISCOVERY", "crawl").lower()
+SITEMAP_MAX_URLS = int(os.getenv("SITEMAP_MAX_URLS", "2000"))
+SITEMAP_MAX_FILES = int(os.getenv("SITEMAP_MAX_FILES", "10"))
+# Cap on the decompressed size read from one sitemap, the protocol's own limit
+SITEMAP_MAX_BYTES = int(os.getenv("SITEMAP_MAX_BYTES", str(50 * 1024 * 1024)))  # 50MB
+SITEMAP_CACHE_SECONDS = float(os.getenv("SITEMAP_CACHE_SECONDS", "3600"))  # 1 hour
+SITEMAP_CACHE_MAX_SITES = int(os.getenv("SITEMAP_CACHE_MAX_SITES", "256"))
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+_sitemap_flight = SingleFlight("sitemap")
+_discovered = OrderedDict()  # site origin -> (links, discovered_at)
+
+
+class SitemapError(Exception):
+    """
+    Raised for a sitemap that cannot be read safely.
+    """
+
+
+async def iter_sitemap(url, max_bytes=SITEMAP_MAX_BYTES):
+    """
+    Stream one sitemap and yield a ("sitemap", url) pair for each child of a sitemap
+    index, or a ("page", url) pair for each page of a URL set.
+
+    The body is decompressed (gzip sitemaps) and parsed incrementally as it arrives,
+    and every parsed entry is dropped from the tree right away, so memory stays
+    bounded however many URLs the sitemap lists. Reading stops at max_bytes.
+    """
+    parser = XMLPullParser(events=("start", "end"))
+    decompressor = None
+    received = 0
+    depth = 0
+    root = kind = None
+
+    async with get_async_client().stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            if not chunk:
+                continue
+            if received == 0 and decompressor is None and chunk.startswith(GZIP_MAGIC):
+                # A .gz file served as is rather than with a Content-Encoding
+                decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+            if decompressor is not None:
+                # Bounding the output also keeps a decompression bomb from inflating
+                chunk = decompressor.decompress(chunk, max_bytes - received + 1)
+            received += len(chunk)
+            if b"<!ENTITY" in chunk:
+                raise SitemapError(f"Refusing to expand entities declared in {url}")
+
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                tag = element.tag.rsplit("}", 1)[-1]
+                if event == "start":
+                    depth += 1
+                    if root is None:
+                        root = element
+                        kind = "sitemap" if tag == "sitemapindex" else "page"
+                    continue
+                depth -= 1
+                # Only the <loc> of an entry, not those of extensions such as <image:loc>
+                if depth == 2 and tag == "loc" and element.text and element.text.strip():
+                    yield kind, element.text.strip()
+                elif depth == 1:
+                    # The entry was handled; drop it so the tree never grows
+                    root.clear()
+
+            if received > max_bytes:
+                configured_logger.warning("Stopped reading %s at %d bytes", url, max_bytes)
+                return
+
+
+def _same_site(host, site):
+    host = (host or "").lower()
+    host = host[4:] if host.startswith("www.") else host
+    return host == site or host.endswith("." + site)
+
+
+async def _discover(origin, site, max_urls):
+    robots = await afetch_robots(origin)
+    queue = deque(robots_sitemaps(robots) or [f"{origin}/sitemap.xml"])
+    queued = set(queue)
+
+    # Keep the max_urls shallowest pages (about, careers, ... rather than blog posts),
+    # in sitemap order, as a bounded max-heap on (depth, order)
+    shallowest = []
+    order = 0
+    files = 0
+    while queue and files < SITEMAP_MAX_FILES:
+        sitemap = queue.popleft()
+        files += 1
+        try:
+            async for kind, loc in iter_sitemap(urljoin(origin, sitemap)):
+                if kind == "sitemap":
+                    if loc not in queued and len(queued) < SITEMAP_MAX_FILES:
+                        queued.add(loc)
+                        queue.append(loc)
+                    continue
+                parts = urlsplit(loc)
+                if parts.scheme not in ("http", "https") or not _same_site(parts.hostname, site):
+                    continue
+                order += 1
+                entry = (-len([segment for segment in parts.path.split("/") if segment]), -order, loc)
+                if len(shallowest) < max_urls:
+                    heapq.heappush(shallowest, entry)
+                elif entry > shallowest[0]:
+                    heapq.heapreplace(shallowest, entry)
+        except (httpx.HTTPError, ParseError, SitemapError) as e:
+            # A missing sitemap is the common case on sites without one
+            missing = isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 404
+            configured_logger.log(
+                logging.DEBUG if missing else logging.WARNING, "Error reading sitemap %s: %s", sitemap, e
+            )
+
+    links = []
+    seen = VisitedIndex()
+    for _, _, loc in sorted(shallowest, reverse=True):
+        link = canonicalize(loc)
+        if seen.add(link):
+            links.append(link)
+    return links, files
+
+
+async def discover_sitemap_links(url, max_urls=SITEMAP_MAX_URLS):
+    """
+    Return up to max_urls page URLs of the url's site listed in its sitemaps, or an
+    empty list if the site publishes none.
+
+    Sitemaps are found through the Sitemap lines of robots.txt, or at /sitemap.xml,
+    and sitemap indexes are followed up to SITEMAP_MAX_FILES files. Results are kept
+    for SITEMAP_CACHE_SECONDS, and concurrent discoveries of one site are coalesced
+    (sharing the max_urls of the first caller).
+    """
+    parts = urlsplit(canonicalize(url))
+    origin = f"{parts.scheme}://{parts.netloc}"
+    cached = _discovered.get(origin)
+    if cached and time.time() - cached[1] < SITEMAP_CACHE_SECONDS:
+        _discovered.move_to_end(origin)
+        return cached[0][:max_urls]
+
+    async def discover():
+        site = (parts.hostname or "").lower()
+        site = site[4:] if site.startswith("www.") else site
+        with span("sitemap_discovery", url=origin) as fields:
+            try:
+                links, files = await _discover(origin, site, max_urls)
+            except httpx.HTTPError as e:
+                configured_logger.warning("Sitemap discovery failed for %s: %s", origin, e)
+                links, files = [], 0
+            fields.update(files=files, links=len(links))
+
+        _discovered[origin] = (links, time.time())
+        _discovered.move_to_end(origin)
+        while len(_discovered) > SITEMAP_CACHE_MAX_SITES:
+            _discovered.popitem(last=False)
+        return links
+
+    return (await _sitemap_flight.do(origin, discover))[:max_urls]
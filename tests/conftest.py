@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root, and every cache, job and analysis
+# database the tests open goes to a throwaway directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="analyzer-tests-")
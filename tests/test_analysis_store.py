@@ -0,0 +1,34 @@
+import sqlite3
+from analysis_store import AnalysisStore
+
+
+def test_analyses_are_only_reused_for_the_same_api_key(tmp_path):
+    store = AnalysisStore(path=str(tmp_path / "analyses.sqlite"))
+    store.save_links("key-a", "https://acme.com", "gpt-4o-mini", "links", {"links": []})
+    store.save_summary("key-a", "https://acme.com/", "gpt-4o-mini", {"https://acme.com/": "hash"}, "key", "Summary")
+
+    stored = store.get("key-a", "https://acme.com/", "gpt-4o-mini")
+
+    assert stored.links_hash == "links"
+    assert stored.summary == "Summary"
+    assert store.get("key-b", "https://acme.com/", "gpt-4o-mini") is None
+    assert store.get("key-a", "https://acme.com/", "gpt-4o") is None
+
+
+def test_analyses_stored_without_an_api_key_are_dropped(tmp_path):
+    path = str(tmp_path / "analyses.sqlite")
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE analyses (url TEXT NOT NULL, model TEXT NOT NULL, links_hash TEXT, selection TEXT,"
+            " pages TEXT, summary_key TEXT, summary TEXT, updated_at REAL NOT NULL, PRIMARY KEY (url, model))"
+        )
+        connection.execute(
+            "INSERT INTO analyses (url, model, summary, updated_at) VALUES ('https://acme.com/', 'gpt-4o-mini', 'Old', 0)"
+        )
+    connection.close()
+
+    store = AnalysisStore(path=path)
+
+    assert store.get("key-a", "https://acme.com/", "gpt-4o-mini") is None
+    store.save_summary("key-a", "https://acme.com/", "gpt-4o-mini", {}, "key", "New")
+    assert store.get("key-a", "https://acme.com/", "gpt-4o-mini").summary == "New"
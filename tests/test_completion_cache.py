@@ -0,0 +1,109 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import completion_cache
+from completion_cache import (
+    CompletionCache,
+    _key_id,
+    acached_completion,
+    cached_completion,
+    completion_key,
+    invalidate_completion,
+)
+
+MESSAGES = [{"role": "user", "content": "Summarize acme.com"}]
+
+
+class FakeClient:
+    """
+    Stands in for an OpenAI client and counts the completions it was asked for.
+    """
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _response(self):
+        self.calls += 1
+        message = SimpleNamespace(content=f"summary {self.calls} for {self.api_key}")
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=message)])
+
+    def create(self, **request):
+        return self._response()
+
+
+class FakeAsyncClient(FakeClient):
+    async def create(self, **request):
+        await asyncio.sleep(0.01)  # Long enough for concurrent callers to overlap
+        return self._response()
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    cache = CompletionCache(path=str(tmp_path / "completions.sqlite"))
+    monkeypatch.setattr(completion_cache, "COMPLETION_CACHE_ENABLED", True)
+    monkeypatch.setattr(completion_cache, "_completion_cache", cache)
+    return cache
+
+
+def test_completion_key_depends_on_every_input():
+    key = completion_key("key-a", "gpt-4o-mini", MESSAGES)
+
+    assert key == completion_key("key-a", "gpt-4o-mini", [dict(message) for message in MESSAGES])
+    assert key != completion_key("key-b", "gpt-4o-mini", MESSAGES)
+    assert key != completion_key("key-a", "gpt-4o", MESSAGES)
+    assert key != completion_key("key-a", "gpt-4o-mini", MESSAGES + [{"role": "user", "content": "More"}])
+    assert key != completion_key("key-a", "gpt-4o-mini", MESSAGES, response_format={"type": "json_object"})
+
+
+def test_key_id_identifies_the_api_key_without_containing_it():
+    key_id = _key_id(FakeClient("sk-secret"))
+
+    assert key_id == _key_id(FakeClient("sk-secret"))
+    assert key_id != _key_id(FakeClient("sk-other"))
+    assert "sk-secret" not in key_id
+
+
+def test_completions_are_reused_for_the_same_api_key(cache):
+    client = FakeClient("sk-a")
+
+    first = cached_completion(client, "gpt-4o-mini", MESSAGES)
+    second = cached_completion(FakeClient("sk-a"), "gpt-4o-mini", MESSAGES)
+
+    assert first == second == "summary 1 for sk-a"
+    assert client.calls == 1
+
+
+def test_completions_are_never_shared_across_api_keys(cache):
+    first, second = FakeClient("sk-a"), FakeClient("sk-b")
+
+    assert cached_completion(first, "gpt-4o-mini", MESSAGES) == "summary 1 for sk-a"
+    assert cached_completion(second, "gpt-4o-mini", MESSAGES) == "summary 1 for sk-b"
+    assert first.calls == second.calls == 1
+
+
+def test_invalidate_completion_only_drops_the_callers_entry(cache):
+    first, second = FakeClient("sk-a"), FakeClient("sk-b")
+    cached_completion(first, "gpt-4o-mini", MESSAGES)
+    cached_completion(second, "gpt-4o-mini", MESSAGES)
+
+    invalidate_completion(first, "gpt-4o-mini", MESSAGES)
+
+    assert cached_completion(first, "gpt-4o-mini", MESSAGES) == "summary 2 for sk-a"
+    assert cached_completion(second, "gpt-4o-mini", MESSAGES) == "summary 1 for sk-b"
+
+
+def test_concurrent_identical_requests_share_one_call_per_api_key(monkeypatch):
+    monkeypatch.setattr(completion_cache, "COMPLETION_CACHE_ENABLED", False)
+    first, second = FakeAsyncClient("sk-a"), FakeAsyncClient("sk-b")
+
+    async def complete_all():
+        return await asyncio.gather(
+            *(acached_completion(client, "gpt-4o-mini", MESSAGES) for client in (first, first, second, second))
+        )
+
+    results = asyncio.run(complete_all())
+
+    assert results == ["summary 1 for sk-a"] * 2 + ["summary 1 for sk-b"] * 2
+    assert first.calls == second.calls == 1
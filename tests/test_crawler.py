@@ -0,0 +1,60 @@
+import asyncio
+from crawler import AsyncCrawler
+from pages import Page, PageCache
+
+
+class _FakePageCache(PageCache):
+    """
+    Serves a fixed site and records every URL the crawler asked for.
+    """
+
+    def __init__(self, pages):
+        super().__init__()
+        self.site = pages
+        self.requested = []
+
+    async def aget(self, url):
+        self.requested.append(url)
+        if url not in self.site:
+            raise LookupError(url)
+        return self.site[url]
+
+
+def _crawl(pages, start_url, max_depth=2):
+    cache = _FakePageCache(pages)
+    result = asyncio.run(AsyncCrawler(max_depth=max_depth, page_cache=cache).crawl(start_url))
+    return result, cache.requested
+
+
+def test_crawl_skips_malformed_and_non_http_links():
+    pages = {
+        "https://acme.com/": Page(
+            "https://acme.com/",
+            links=("http://[::1/", "mailto:info@acme.com", "tel:+1555", "ftp://acme.com/f", "https://acme.com/b"),
+            anchors=("", "", "", "", "B"),
+        ),
+        "https://acme.com/b": Page("https://acme.com/b"),
+    }
+
+    result, requested = _crawl(pages, "https://acme.com/")
+
+    assert result.links == ["https://acme.com/b"]
+    assert sorted(requested) == ["https://acme.com/", "https://acme.com/b"]
+    assert result.errors == {}
+
+
+def test_crawl_fetches_each_page_once_whatever_its_spelling():
+    pages = {
+        "https://acme.com/": Page(
+            "https://acme.com/",
+            links=("https://acme.com/b", "https://ACME.com/b#team", "https://acme.com/b?utm_source=x"),
+            anchors=("B", "", ""),
+        ),
+        "https://acme.com/b": Page("https://acme.com/b", links=("https://acme.com/",), anchors=("Home",)),
+    }
+
+    result, requested = _crawl(pages, "https://acme.com/", max_depth=3)
+
+    assert result.links == ["https://acme.com/b"]
+    assert sorted(requested) == ["https://acme.com/", "https://acme.com/b"]
+    assert result.anchors["https://acme.com/b"] == "B"
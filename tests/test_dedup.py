@@ -0,0 +1,61 @@
+from dedup import ContentDeduplicator, hamming_distance, simhash
+
+NAVIGATION = "Home\nProducts\nCareers\nContact"
+FOOTER = "© 2025 Acme Corporation. All rights reserved. Registered in England."
+ROCKETS = (
+    "Acme builds reusable rockets for small satellite operators. Our engines burn liquid "
+    "methane and oxygen, and every first stage lands back at the launch site within minutes. "
+    "Customers book a slot online and ship their payload to our integration hall in Texas."
+)
+PONDS = (
+    "Garden ponds need shade, oxygenating plants and a pump that turns the water over twice "
+    "an hour. Koi grow quickly in warm summers, so plan the depth before digging, and keep "
+    "herons away with a net stretched low across the surface during the winter months."
+)
+
+
+def _respelled(text):
+    # The same words with different case, punctuation and line breaks
+    return text.upper().replace(". ", "!\n").replace(",", " -")
+
+
+def test_simhash_ignores_case_punctuation_and_spacing():
+    assert simhash(_respelled(ROCKETS)) == simhash(ROCKETS)
+
+
+def test_simhash_is_far_apart_for_unrelated_texts():
+    assert hamming_distance(simhash(ROCKETS), simhash(PONDS)) > 6
+
+
+def test_first_page_is_kept_unchanged():
+    text = f"{NAVIGATION}\n{ROCKETS}\n{FOOTER}"
+
+    assert ContentDeduplicator().filter("https://acme.com/", text) == text
+
+
+def test_repeated_navigation_and_footer_are_removed():
+    deduplicator = ContentDeduplicator()
+    deduplicator.filter("https://acme.com/", f"{NAVIGATION}\n{ROCKETS}\n{FOOTER}")
+
+    filtered = deduplicator.filter("https://acme.com/pond", f"{NAVIGATION}\n{PONDS}\n{FOOTER}")
+
+    assert filtered == PONDS
+    assert deduplicator.lines_removed == 5
+    assert deduplicator.chars_saved > len(FOOTER)
+
+
+def test_short_lines_are_only_removed_as_part_of_a_repeated_run():
+    deduplicator = ContentDeduplicator()
+    deduplicator.filter("https://acme.com/", f"Home\n{ROCKETS}")
+
+    filtered = deduplicator.filter("https://acme.com/pond", f"Home\n{PONDS}")
+
+    assert filtered.startswith("Home\n")
+
+
+def test_near_duplicate_pages_are_dropped():
+    deduplicator = ContentDeduplicator()
+    deduplicator.filter("https://acme.com/careers", ROCKETS)
+
+    assert deduplicator.filter("https://acme.com/jobs", _respelled(ROCKETS)) is None
+    assert deduplicator.pages_dropped == 1
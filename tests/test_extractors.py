@@ -0,0 +1,41 @@
+import pytest
+from extractors import EXTRACTORS, resolve_link
+
+MALFORMED_PAGE = b"""
+<html>
+  <head><title>Acme</title></head>
+  <body>
+    <a href="//[oops/x">Broken host</a>
+    <a href="http://[::1/">Broken absolute</a>
+    <a href="javascript:void(0)">Script</a>
+    <a href="#top">Fragment</a>
+    <a href="/about">About</a>
+    <a href="https://acme.com/careers">Careers</a>
+  </body>
+</html>
+"""
+
+
+@pytest.mark.parametrize(
+    "href, expected",
+    [
+        ("/about", "https://acme.com/about"),
+        ("https://other.com/x", "https://other.com/x"),
+        ("", None),
+        ("javascript:void(0)", None),
+        ("#top", None),
+        ("//[oops/x", None),
+        ("http://[::1/", None),
+    ],
+)
+def test_resolve_link(href, expected):
+    assert resolve_link("https://acme.com/", href) == expected
+
+
+@pytest.mark.parametrize("name", sorted(EXTRACTORS))
+def test_extractors_skip_malformed_links(name):
+    title, text, links, anchors = EXTRACTORS[name]().extract("https://acme.com/", MALFORMED_PAGE)
+
+    assert title == "Acme"
+    assert links == ("https://acme.com/about", "https://acme.com/careers")
+    assert anchors == ("About", "Careers")
@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import jobs
+from jobs import COMPLETED, FAILED, JobFailed, JobQueue, JobStore
+
+
+class _DroppedStream(jobs.JobOutputStrategy):
+    """
+    Streams part of a summary, then fails once the test releases it.
+    """
+
+    release = None
+
+    async def handle_output(self, messages):
+        self.job.append("Acme builds ")
+        await self.release.wait()
+        raise RuntimeError("stream dropped")
+
+
+async def _prepare_nothing(company_name, url, client=None, model=None):
+    return SimpleNamespace(summary=None, messages=[])
+
+
+async def _prepare_timeout(company_name, url, client=None, model=None):
+    raise asyncio.TimeoutError()
+
+
+async def _prepare_stored(company_name, url, client=None, model=None):
+    return SimpleNamespace(summary="Acme builds rockets.", messages=[])
+
+
+async def _follow(queue, job_id, offset=0):
+    parts = []
+    try:
+        async for content in queue.stream(job_id, offset):
+            parts.append(content)
+    except JobFailed as failure:
+        return "".join(parts), str(failure)
+    return "".join(parts), None
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(workers=1, store=JobStore(path=str(tmp_path / "jobs.sqlite")))
+
+
+def test_followers_of_a_failed_job_get_its_partial_output_and_the_error(monkeypatch, queue):
+    monkeypatch.setattr(jobs, "aprepare_summary", _prepare_nothing)
+    monkeypatch.setattr(jobs, "JobOutputStrategy", _DroppedStream)
+
+    async def run():
+        _DroppedStream.release = asyncio.Event()
+        job_id = await queue.submit("Acme", "https://acme.com", api_key="sk-test", model="gpt-4o-mini")
+        live = asyncio.create_task(_follow(queue, job_id))
+        while not queue._live[job_id].parts:
+            await asyncio.sleep(0.001)
+        _DroppedStream.release.set()
+        live_result = await live
+        await queue._queue.join()
+
+        replayed = await _follow(queue, job_id)
+        resumed = await _follow(queue, job_id, offset=5)
+        status = await queue.status(job_id)
+        await queue.stop()
+        return live_result, replayed, resumed, status
+
+    live, replayed, resumed, status = asyncio.run(run())
+
+    assert live == replayed == ("Acme builds ", "stream dropped")
+    assert resumed == ("builds ", "stream dropped")
+    assert status["status"] == FAILED
+    assert status["error"] == "stream dropped"
+    assert status["length"] == len("Acme builds ")
+    assert "result" not in status
+
+
+def test_a_failure_without_a_message_still_fails_the_job(monkeypatch, queue):
+    monkeypatch.setattr(jobs, "aprepare_summary", _prepare_timeout)
+
+    async def run():
+        job_id = await queue.submit("Acme", "https://acme.com", api_key="sk-test", model="gpt-4o-mini")
+        await queue._queue.join()
+        replayed = await _follow(queue, job_id)
+        status = await queue.status(job_id)
+        await queue.stop()
+        return replayed, status
+
+    replayed, status = asyncio.run(run())
+
+    assert replayed == ("", "TimeoutError")
+    assert status["status"] == FAILED
+    assert status["error"] == "TimeoutError"
+
+
+def test_completed_jobs_are_replayed_from_the_store(monkeypatch, queue):
+    monkeypatch.setattr(jobs, "aprepare_summary", _prepare_stored)
+
+    async def run():
+        job_id = await queue.submit("Acme", "https://acme.com", api_key="sk-test", model="gpt-4o-mini")
+        await queue._queue.join()
+        replayed = await _follow(queue, job_id)
+        status = await queue.status(job_id)
+        await queue.stop()
+        return replayed, status
+
+    replayed, status = asyncio.run(run())
+
+    assert replayed == ("Acme builds rockets.", None)
+    assert status["status"] == COMPLETED
+    assert status["result"] == "Acme builds rockets."
+
+
+def test_streaming_an_unknown_job_raises_key_error(queue):
+    with pytest.raises(KeyError):
+        asyncio.run(_follow(queue, "missing"))
@@ -0,0 +1,31 @@
+from pages import parse_page
+
+
+class _FixedExtractor:
+    def __init__(self, links, anchors):
+        self.links = links
+        self.anchors = anchors
+
+    def extract(self, url, body):
+        return "Title", "Text", self.links, self.anchors
+
+
+def test_parse_page_skips_invalid_links_and_keeps_anchors_aligned():
+    extractor = _FixedExtractor(
+        ("https://a.com/one", "http://[::1/", "https://a.com/two"),
+        ("One", "Broken", "Two"),
+    )
+
+    page = parse_page("https://a.com/", b"", extractor=extractor)
+
+    assert page.links == ("https://a.com/one", "https://a.com/two")
+    assert page.anchors == ("One", "Two")
+
+
+def test_parse_page_resolves_relative_links_against_the_final_url():
+    body = b'<html><body><a href="team">Team</a></body></html>'
+
+    page = parse_page("https://a.com/about", body, final_url="https://b.com/company/")
+
+    assert page.final_url == "https://b.com/company/"
+    assert page.links == ("https://b.com/company/team",)
@@ -0,0 +1,37 @@
+import pytest
+from renderer import FenceStripper
+
+
+def _strip(chunks):
+    stripper = FenceStripper()
+    return "".join(stripper.feed(chunk) for chunk in chunks) + stripper.flush()
+
+
+def test_fences_within_a_chunk_are_removed():
+    assert _strip(["```markdown\n# Acme\n```"]) == "\n# Acme\n"
+
+
+@pytest.mark.parametrize("split", range(1, len("```markdown\n# Acme\n```")))
+def test_fences_split_across_chunks_are_removed(split):
+    text = "```markdown\n# Acme\n```"
+
+    assert _strip([text[:split], text[split:]]) == "\n# Acme\n"
+
+
+def test_fences_split_into_single_characters_are_removed():
+    assert _strip(list("Intro\n```markdown\n# Acme\n```\nDone")) == "Intro\n\n# Acme\n\nDone"
+
+
+def test_backticks_that_never_become_a_fence_are_kept():
+    stripper = FenceStripper()
+
+    assert stripper.feed("Use `code` and ``") == "Use `code` and "
+    assert stripper.feed(" more") == "`` more"
+    assert stripper.flush() == ""
+
+
+def test_a_held_back_tail_is_flushed_at_the_end():
+    stripper = FenceStripper()
+
+    assert stripper.feed("Total: `") == "Total: "
+    assert stripper.flush() == "`"
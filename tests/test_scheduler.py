@@ -0,0 +1,25 @@
+import asyncio
+from scheduler import AdaptiveLimiter
+
+
+def _release_all(limiter, latencies, overloaded=False):
+    async def run():
+        for latency in latencies:
+            await limiter.acquire()
+            await limiter.release(latency=latency, overloaded=overloaded)
+
+    asyncio.run(run())
+    return limiter.limit
+
+
+def test_slow_answers_lower_the_limit():
+    limiter = AdaptiveLimiter(16, 1, 64, latency_tolerance=3)
+
+    assert _release_all(limiter, [0.02, 0.15] * 16) < 16
+
+
+def test_without_a_latency_tolerance_only_overload_lowers_the_limit():
+    limiter = AdaptiveLimiter(16, 1, 64, latency_tolerance=None)
+
+    assert _release_all(limiter, [0.02, 0.15] * 16) > 16
+    assert _release_all(limiter, [None], overloaded=True) < 16
@@ -0,0 +1,81 @@
+import pytest
+from urls import BloomFilter, VisitedIndex, _digest, canonicalize, url_key
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("HTTPS://Acme.COM:443/About#team", "https://acme.com/About"),
+        ("http://acme.com:8080", "http://acme.com:8080/"),
+        ("https://acme.com/a/../b/./c", "https://acme.com/b/c"),
+        ("https://acme.com/?utm_source=x&id=1&gclid=y&UTM_medium=z", "https://acme.com/?id=1"),
+        ("https://acme.com/?b=2&a=1", "https://acme.com/?b=2&a=1"),
+        ("https://acme.com./", "https://acme.com/"),
+        ("http://[::1]:80/x", "http://[::1]/x"),
+        ("mailto:info@acme.com", "mailto:info@acme.com"),
+    ],
+)
+def test_canonicalize(url, expected):
+    assert canonicalize(url) == expected
+
+
+def test_canonicalize_rejects_malformed_hosts():
+    with pytest.raises(ValueError):
+        canonicalize("http://[::1/")
+
+
+def test_url_key_ignores_the_trailing_slash():
+    assert url_key("https://acme.com/about/") == url_key("https://acme.com/about") == "https://acme.com/about"
+    assert url_key("https://acme.com") == "https://acme.com/"
+
+
+def test_visited_index_treats_spellings_of_one_page_as_one():
+    visited = VisitedIndex()
+
+    assert visited.add("https://acme.com/about")
+    assert not visited.add("HTTPS://acme.com/about/?utm_source=mail#top")
+    assert "https://acme.com/about/" in visited
+    assert "https://acme.com/careers" not in visited
+    assert len(visited) == 1
+
+
+def test_visited_index_merges_exact_indexes():
+    first, second = VisitedIndex(), VisitedIndex()
+    first.add("https://acme.com/a")
+    second.add("https://acme.com/a")
+    second.add("https://acme.com/b")
+
+    first.update(second)
+
+    assert "https://acme.com/b" in first
+    assert len(first) == 2
+
+
+def test_visited_index_cannot_merge_bloom_and_exact_indexes():
+    with pytest.raises(ValueError):
+        VisitedIndex().update(VisitedIndex(bloom_capacity=100))
+
+
+def test_bloom_index_has_no_false_negatives():
+    visited = VisitedIndex(bloom_capacity=1000)
+    urls = [f"https://acme.com/page/{i}" for i in range(1000)]
+    for url in urls:
+        visited.add(url)
+
+    assert all(url in visited for url in urls)
+    false_positives = sum(f"https://acme.com/other/{i}" in visited for i in range(10000))
+    assert false_positives < 100  # About 10 expected at the default 0.1% error rate
+
+
+def test_bloom_filters_of_different_sizes_cannot_be_merged():
+    with pytest.raises(ValueError):
+        BloomFilter(100).update(BloomFilter(1000))
+
+
+def test_bloom_filter_add_reports_new_items():
+    bloom = BloomFilter(100)
+    digest = _digest("https://acme.com/")
+
+    assert bloom.add(digest)
+    assert not bloom.add(digest)
+    assert digest in bloom
@@ -0,0 +1,171 @@
+import hashlib
+import math
+import os
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from dotenv import load_dotenv
+
+load_dotenv()
+# Size the visited index as a Bloom filter for this many URLs (0 keeps an exact hashed set)
+VISITED_BLOOM_CAPACITY = int(os.getenv("VISITED_BLOOM_CAPACITY", "0"))
+VISITED_BLOOM_ERROR_RATE = float(os.getenv("VISITED_BLOOM_ERROR_RATE", "0.001"))
+
+# Query parameters that only track where a visitor came from, never change the page
+TRACKING_PARAMS = {
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "igshid", "twclid", "li_fat_id",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok", "oly_anon_id", "oly_enc_id",
+    "vero_id", "wickedid", "rb_clickid", "s_cid",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _is_tracking(param):
+    name = param.split("=", 1)[0].lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize(url):
+    """
+    Normalize a URL so trivially different spellings of one page compare equal.
+
+    The scheme and host are lowercased, default ports, the fragment and tracking
+    parameters (utm_*, gclid, fbclid, ...) are dropped and dot segments are resolved.
+    The remaining query is kept byte for byte. The result is still the URL to fetch;
+    non-http(s) URLs are returned unchanged.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS:
+        return url
+
+    host = (parts.hostname or "").rstrip(".")
+    netloc = host if ":" not in host else f"[{host}]"  # IPv6 literals keep their brackets
+    try:
+        port = parts.port
+    except ValueError:  # An invalid port is left for the fetch to reject
+        port = None
+        netloc = parts.netloc.lower()
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{port}"
+    if parts.username or parts.password:
+        netloc = parts.netloc.rsplit("@", 1)[0] + "@" + netloc
+
+    path = parts.path or "/"
+    if "/." in path:
+        path = urlsplit(urljoin(f"{scheme}://{netloc}/", path)).path
+
+    query = "&".join(
+        param for param in parts.query.split("&") if param and not _is_tracking(param)
+    )
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def url_key(url):
+    """
+    The identity of a page: its canonical URL with the trailing slash of the path
+    dropped, so /about and /about/ are one page. Use canonicalize() for the URL to fetch.
+    """
+    parts = urlsplit(canonicalize(url))
+    if len(parts.path) > 1 and parts.path.endswith("/"):
+        parts = parts._replace(path=parts.path.rstrip("/") or "/")
+    return urlunsplit(parts)
+
+
+def _digest(url):
+    return hashlib.blake2b(url_key(url).encode("utf-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+    """
+    A fixed-size probabilistic set: membership tests may give false positives at
+    about error_rate once `capacity` items were added, but never false negatives.
+    """
+
+    def __init__(self, capacity, error_rate=VISITED_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        # Double hashing: k positions from the two 64-bit halves of one digest
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, digest):
+        """
+        Add an item by its digest; returns True if it was (probably) not present yet.
+        """
+        added = False
+        for position in self._positions(digest):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                added = True
+        return added
+
+    def __contains__(self, digest):
+        return all(
+            self._bits[position // 8] & (1 << (position % 8)) for position in self._positions(digest)
+        )
+
+    def update(self, other):
+        if (other.size, other.hashes) != (self.size, self.hashes):
+            raise ValueError("Only Bloom filters of the same size can be merged")
+        for i, byte in enumerate(other._bits):
+            self._bits[i] |= byte
+
+
+class VisitedIndex:
+    """
+    The set of pages a crawl has seen, keyed by url_key().
+
+    URLs are stored as 64-bit hashes rather than strings, so the index stays small
+    however long the URLs are. With a bloom_capacity it is a Bloom filter of fixed
+    size instead, for very large crawls that can afford to skip a few pages on
+    false positives.
+    """
+
+    def __init__(self, bloom_capacity=VISITED_BLOOM_CAPACITY, error_rate=VISITED_BLOOM_ERROR_RATE):
+        self._bloom = BloomFilter(bloom_capacity, error_rate) if bloom_capacity > 0 else None
+        self._hashes = set()
+        self._count = 0
+
+    def add(self, url):
+        """
+        Mark a URL as seen; returns True if it was not seen before.
+        """
+        digest = _digest(url)
+        if self._bloom is not None:
+            added = self._bloom.add(digest)
+        else:
+            fingerprint = int.from_bytes(digest[:8], "little")
+            added = fingerprint not in self._hashes
+            self._hashes.add(fingerprint)
+        self._count += added
+        return added
+
+    def update(self, other):
+        """
+        Merge another VisitedIndex of the same kind into this one.
+        """
+        if (self._bloom is None) != (other._bloom is None):
+            raise ValueError("Cannot merge a Bloom filter index with an exact one")
+        if self._bloom is not None:
+            self._bloom.update(other._bloom)
+            self._count += other._count
+        else:
+            self._hashes |= other._hashes
+            self._count = len(self._hashes)
+
+    def __contains__(self, url):
+        digest = _digest(url)
+        if self._bloom is not None:
+            return digest in self._bloom
+        return int.from_bytes(digest[:8], "little") in self._hashes
+
+    def __len__(self):
+        # Approximate for Bloom filters, whose merges may count shared URLs twice
+        return self._count